@@ -0,0 +1,152 @@
+import time
+
+import numpy as np
+
+from .solution import Solution
+from .utils import CSRGraph, Deadline
+
+
+def perturbed_graph(g, rng, noise=0.25):
+    """
+    The graph G with each weight multiplied by a random factor in [1, 1 + noise],
+    the weights being scaled by 100 to stay integers.
+    """
+    factors = rng.integers(100, int(100 * (1 + noise)) + 1, size=len(g.edge_w))
+
+    return CSRGraph(len(g), g.edge_u, g.edge_v, g.edge_w * factors, labels=g.labels)
+
+
+class IteratedLocalSearch:
+    """
+    Continue the local search after a local optimum is reached, following the
+    multistart approach of Uchoa and Werneck: the weights of G are perturbed
+    with random noise, S is improved by the local search in the perturbed
+    graph, which leads it out of the local optimum, then S is improved again
+    in G. Each iteration starts from the current solution.
+
+    A new local optimum becomes the current solution if its weight is at most
+    (1 + acceptance) times the weight of the current solution. The best
+    distinct solutions found are kept in an elite pool, after restart_after
+    iterations without improving the best solution, the search restarts from
+    a random elite solution. The subclasses can change when and where the
+    search restarts by overriding restart(), and be notified of the
+    improvements of the best solution by overriding improved().
+
+    The noise and the choice of the elite solutions are drawn from a random
+    generator with a fixed seed, thus a run is reproducible, unless it is
+    stopped by the deadline.
+
+    All the local searches share the VND of the method, given by vnd or
+    method.neighborhood_descent(), which keeps the statistics of the
+    neighborhoods over the iterations.
+    """
+    def __init__(self, g, terminals, method, seed=0, noise=0.25, acceptance=0.0,
+                 elite_size=5, restart_after=10, early_stop=True, vnd=None):
+        self.g = g
+        self.terminals = terminals
+        self.method = method
+        self.vnd = vnd if vnd is not None else method.neighborhood_descent()
+        self.rng = np.random.default_rng(seed)
+        self.noise = noise
+        self.acceptance = acceptance
+        self.elite_size = elite_size
+        self.restart_after = restart_after
+        self.early_stop = early_stop
+
+        self.elite = []  # the elite solutions, as tuples (weight, edges), sorted by weight
+        self.history = []  # the times the best solution improved, with its weight
+        self.n_iterations = 0
+
+    def descend(self, s, deadline):
+        """
+        Apply the local search to S until it reaches a local optimum.
+        """
+        while not deadline.expired():
+            s_weight = s.weight
+            self.method.local_search(s.g, s, self.terminals, early_stop=self.early_stop,
+                                     deadline=deadline, vnd=self.vnd)
+
+            if s.weight >= s_weight:
+                break
+
+        return s
+
+    def perturb(self, s, deadline):
+        """
+        Move S to a nearby local optimum: S is improved in a perturbed graph,
+        then in G.
+        """
+        h = perturbed_graph(self.g, self.rng, self.noise)
+        s = self.descend(Solution(h, h.edge_subgraph(s.edges), self.terminals), deadline)
+
+        g = self.g
+        return self.descend(Solution(g, g.edge_subgraph(s.edges), self.terminals), deadline)
+
+    def _add_elite(self, s):
+        edges = frozenset(tuple(sorted(e)) for e in s.edges)
+        if any(elite_edges == edges for _, elite_edges in self.elite):
+            return
+
+        self.elite.append((s.weight, edges))
+        self.elite.sort(key=lambda elite: elite[0])
+        del self.elite[self.elite_size:]
+
+    def _restart(self):
+        _, edges = self.elite[self.rng.integers(len(self.elite))]
+
+        return Solution(self.g, self.g.edge_subgraph(edges), self.terminals)
+
+    def improved(self, s):
+        """
+        Record the improvement of the best solution to S.
+        """
+        self.history.append((time.time(), s.weight))
+
+    def restart(self, current, stall, deadline):
+        """
+        The solution to continue the search from instead of the current one,
+        after stall iterations without improvement, or None to keep the
+        current one: a random elite solution every restart_after iterations.
+        """
+        if stall and stall % self.restart_after == 0:
+            return self._restart()
+
+        return None
+
+    def run(self, s, deadline=Deadline(), max_stall=None):
+        """
+        Iterate from the local optimum S until the deadline, or until max_stall
+        iterations in a row do not improve the best solution, if provided.
+        Return the best solution found.
+        """
+        best = current = s
+        self._add_elite(s)
+        stall = 0
+
+        while not deadline.expired() and (max_stall is None or stall < max_stall):
+            self.n_iterations += 1
+            s = self.perturb(current, deadline)
+            self._add_elite(s)
+
+            if s.weight < best.weight:
+                best = s
+                stall = 0
+                self.improved(s)
+            else:
+                stall += 1
+
+            if s.weight <= (1 + self.acceptance) * current.weight:
+                current = s
+
+            restart = self.restart(current, stall, deadline)
+            if restart is not None:
+                current = restart
+                self._add_elite(current)
+
+                # A new local optimum can be better than the best solution
+                if current.weight < best.weight:
+                    best = current
+                    stall = 0
+                    self.improved(current)
+
+        return best
@@ -1,10 +1,12 @@
-from copy import deepcopy
+import heapq
 from itertools import chain
 
 import networkx as nx
-from networkx.utils import groups, pairwise
+import numpy as np
+from networkx.utils import UnionFind, groups, pairwise
 
-from .utils import graph_weight, prune_tree
+from .utils import Deadline, bounded_dijkstra, dijkstra, graph_weight, prune_tree
+from .vnd import VariableNeighborhoodDescent
 
 
 class VoronoiDiagram:
@@ -19,51 +21,96 @@ class VoronoiDiagram:
     base of the region containing v; p(v) is the predecessor of v on the shortest path from
     base(v) (if v is a base, then p(v) = v); and vdist(v) is the distance from base(v) to v.
 
-    Here for each vertex v, we store the path from base(v) to v instead of the predecessor,
-    as we don't really need to use the predecessor, but the path from the base to construct
-    the shortest path between two bases.
+    The three pieces of information are stored in flat arrays indexed by the vertices,
+    the path from base(v) to v is reconstructed on demand by following the predecessors.
+
+    The cells of the diagram, which is a mapping from a center to the nodes in its cell,
+    are indexed in cells and kept up to date together with the bases.
+
+    The diagram can be modified tentatively: every change is recorded in a journal,
+    so that rollback() restores the diagram of the centers it was built from.
+    The changes are never kept, the callers must always roll them back.
     """
     def __init__(self, g, centers):
-        dists, paths = nx.multi_source_dijkstra(g, centers)
+        self.dists, self.preds, self.bases = dijkstra(g, centers)
+        self.cells = groups(dict(enumerate(self.bases.tolist())))
+        self.journal = []
+
+    def cell_union(self, centers):
+        """
+        The union of the cells of the given centers.
+        """
+        return CellUnion(self, centers)
+
+    def path(self, v):
+        """
+        The shortest path from base(v) to v.
+        """
+        path = [v]
+        while self.preds[v] != v:
+            v = int(self.preds[v])
+            path.append(v)
 
-        self.bases = {}
-        self.paths = {}
-        self.dists = {}
+        return path[::-1]
 
-        for v, path in paths.items():
-            # path is the Dijkstra path from a center to v
+    def assign(self, v, base, pred, dist):
+        """
+        Assign v to the cell of base, recording the previous assignment.
+        """
+        self.journal.append((v, self.bases[v], self.preds[v], self.dists[v]))
+        self._set(v, base, pred, dist)
 
-            # Determine the center node from which the shortest path originates
-            base = path[0]
+    def _set(self, v, base, pred, dist):
+        old_cell = self.cells[self.bases[v]]
+        old_cell.remove(v)
+        if not old_cell:
+            del self.cells[self.bases[v]]
 
-            # The distance from the base to v
-            dist = dists[v]
+        self.cells.setdefault(int(base), set()).add(v)
 
-            self.bases[v] = base
-            self.paths[v] = path
-            self.dists[v] = dist
+        self.bases[v] = base
+        self.preds[v] = pred
+        self.dists[v] = dist
 
-    @property
-    def cells(self):
+    def rollback(self):
         """
-        The cells of a Voronoi diagram, which is a mapping from a center
-        to the nodes in its cell.
+        Undo the changes recorded in the journal.
         """
-        return groups(self.bases)
+        for v, base, pred, dist in reversed(self.journal):
+            self._set(v, base, pred, dist)
 
-    def copy(self):
+        self.journal = []
+
+    def reassign(self, g, unassigned_vertices):
         """
-        Make a copy of a Voronoi diagram to modify it without affecting
-        the original diagram.
+        Assign each vertex in unassigned_vertices to the cell of the nearest
+        base outside of unassigned_vertices.
+
+        The nearest base of an unassigned vertex u is reached through the first
+        assigned vertex w on the shortest path, whose base and distance are still
+        valid. Thus we reseed the search from the assigned neighbors of the
+        unassigned vertices, and run one multi-source Dijkstra limited to the
+        unassigned vertices.
         """
-        cls = self.__class__
-        voronoi = cls.__new__(cls)
+        seeds = []
+        for u in unassigned_vertices:
+            for w, weight in zip(*g.adjacency(u)):
+                if w not in unassigned_vertices:
+                    seeds.append((self.dists[w] + weight, u, w))
+
+        # The predecessor of u is settled before u, so its base is known
+        for u, dist, pred in bounded_dijkstra(g, seeds, unassigned_vertices):
+            self.assign(u, self.bases[pred], pred, dist)
 
-        voronoi.bases = deepcopy(self.bases)
-        voronoi.paths = deepcopy(self.paths)
-        voronoi.dists = deepcopy(self.dists)
+    def remove_center(self, g, center):
+        """
+        Remove a center from the diagram, and reassign the vertices in its cell
+        to the remaining cells. Return the reassigned vertices.
+        """
+        unassigned_vertices = set(self.cells[center])
+        self.reassign(g, unassigned_vertices)
 
-        return voronoi
+        return unassigned_vertices
 
     def repair(self, g, s, key_path):
         """
@@ -77,16 +124,26 @@ class VoronoiDiagram:
         cells in the repaired Voronoi diagram of the vertices in two components.
         """
         internal_vertices = key_path[1:-1]
-        new_s = s.copy()
-        new_s.remove_edges_from(pairwise(key_path))
-        new_s.remove_nodes_from(internal_vertices)
 
-        # The vertices of the two subtrees created after removing the key path
-        s1, s2 = list(nx.connected_components(new_s))
-
-        # Join the Voronoi cells
-        s1_cells = set.union(*(self.cells[v] for v in s1))
-        s2_cells = set.union(*(self.cells[v] for v in s2))
+        # The vertices of the two subtrees created after removing the key path.
+        # We find the first one by walking S from one end of the key path,
+        # without crossing the first edge of the key path
+        s1 = {key_path[0]}
+        stack = [key_path[0]]
+        while stack:
+            u = stack.pop()
+            for w in s[u]:
+                if w not in s1 and (u, w) != (key_path[0], key_path[1]):
+                    s1.add(w)
+                    stack.append(w)
+
+        s2 = set(s.nodes) - s1
+        s2.difference_update(internal_vertices)
+
+        # Join the Voronoi cells. The unions are views of the cells, thus
+        # the vertices reassigned below are added to them automatically
+        s1_cells = self.cell_union(s1)
+        s2_cells = self.cell_union(s2)
 
         if internal_vertices:
             # We need to reassign the vertices in the cells of
@@ -94,37 +151,33 @@ class VoronoiDiagram:
             # corresponding to the two subtrees of S
 
             # The vertices unassigned after removing the key path
-            unassigned_vertices = set.union(*(self.cells[v] for v in internal_vertices))
+            unassigned_vertices = set(self.cell_union(internal_vertices))
             assert len(s1_cells) + len(s2_cells) + len(unassigned_vertices) == len(g)
 
-            # For each unassigned vertex u, we find the nearest vertex v in the two subtrees,
-            # then assign u to the Voronoi cell of v
-            for u in unassigned_vertices:
-                dists, paths = nx.single_source_dijkstra(g, u)
+            self.reassign(g, unassigned_vertices)
 
-                # Filter the dijkstra dists and paths to look for paths to
-                # the vertices in s1 and s2 only
-                dists = {v: dists[v] for v in s1 | s2}
-                paths = {v: paths[v] for v in s1 | s2}
+        return s1_cells, s2_cells
 
-                # Find the new base for u, which is the vertex in s1 ∪ s2 nearest to u
-                base = min(dists, key=dists.get)
-                self.bases[u] = base
 
-                # We need to reverse the path since a Voronoi path
-                # starts from the base
-                path = paths[base]
-                self.paths[u] = path[::-1]
+class CellUnion:
+    """
+    The union of the Voronoi cells of a set of centers, without materialising it:
+    a vertex is in the union if and only if its base is one of the centers.
+    """
+    def __init__(self, voronoi, centers):
+        self.voronoi = voronoi
+        self.centers = set(centers)
 
-                self.dists[u] = dists[base]
+    def __contains__(self, v):
+        return self.voronoi.bases[v] in self.centers
 
-                # Add u to the corresponding node set
-                if base in s1:
-                    s1_cells.add(u)
-                else:
-                    s2_cells.add(u)
+    def __iter__(self):
+        cells = self.voronoi.cells
+        return chain.from_iterable(cells.get(center, ()) for center in self.centers)
 
-        return s1_cells, s2_cells
+    def __len__(self):
+        cells = self.voronoi.cells
+        return sum(len(cells.get(center, ())) for center in self.centers)
 
 
 def boundary_edge_cost(edge, weight, voronoi):
@@ -138,6 +191,29 @@ def boundary_edge_cost(edge, weight, voronoi):
     return voronoi.dists[u] + weight + voronoi.dists[v]
 
 
+def best_boundary_edge(g, voronoi, s1_cells, s2_cells):
+    """
+    Find the cheapest boundary edge between two unions of Voronoi cells which
+    partition V_G. Each vertex is labelled with its side through its base, then
+    the costs of all the crossing edges are computed in one pass over the edge
+    arrays of G. Return the edge and its cost.
+    """
+    side = np.full(len(g), -1, dtype=np.int8)
+    side[list(s1_cells.centers)] = 0
+    side[list(s2_cells.centers)] = 1
+
+    labels = side[voronoi.bases]
+    crossing = np.flatnonzero(labels[g.edge_u] != labels[g.edge_v])
+
+    us = g.edge_u[crossing]
+    vs = g.edge_v[crossing]
+    costs = voronoi.dists[us] + g.edge_w[crossing] + voronoi.dists[vs]
+
+    i = np.argmin(costs)
+
+    return (int(us[i]), int(vs[i])), float(costs[i])
+
+
 def base_path(u, v, voronoi):
     """
     Find the path connecting base(u) and base(v), given that
@@ -145,42 +221,138 @@ def base_path(u, v, voronoi):
     """
     assert voronoi.bases[u] != voronoi.bases[v]
 
-    return voronoi.paths[u] + voronoi.paths[v][::-1]
+    return voronoi.path(u) + voronoi.path(v)[::-1]
 
 
-def auxiliary_graph(g, voronoi):
+def boundary_edges(g, voronoi):
+    """
+    Find the boundary edges of a Voronoi diagram over the edge arrays of G.
+    Return the arrays of the two bases connected by each boundary edge, the
+    smaller one first, the cost of the boundary edge and its endpoints.
     """
-    Construct the auxiliary graph G' of G w.r.t. to a set of centers.
+    bases, dists = voronoi.bases, voronoi.dists
+    base_u, base_v = bases[g.edge_u], bases[g.edge_v]
+    boundary = base_u != base_v
+
+    us, vs = g.edge_u[boundary], g.edge_v[boundary]
+    a = np.minimum(base_u, base_v)[boundary]
+    b = np.maximum(base_u, base_v)[boundary]
+    costs = dists[us] + g.edge_w[boundary] + dists[vs]
+
+    return a, b, costs, us, vs
+
+
+def auxiliary_edges(g, voronoi):
+    """
+    Construct the edges of the auxiliary graph G' of G w.r.t. to a set of centers.
     The nodes of G' correspond to the centers provided. For each boundary edge
     (u, v) in the Voronoi diagram, G' has an edge between base(u) and base(v),
-    with the weight of dist(u) + weight(u, v) + dist(v). Here we only store
+    with the weight of dist(u) + weight(u, v) + dist(v). Here we only keep
     such edges with min distance among the boundary edges connecting the same
     Voronoi regions, together with the chosen boundary edges connecting them.
+
+    Return the list of tuples (weight, base_u, base_v, u, v), sorted by weight.
     """
-    aux = nx.Graph()
+    a, b, costs, us, vs = boundary_edges(g, voronoi)
+
+    if not len(costs):
+        return []
+
+    # Group the boundary edges by the pair of regions they connect,
+    # the cheapest edge of each group being the first one
+    order = np.lexsort((costs, b, a))
+    a, b, costs, us, vs = a[order], b[order], costs[order], us[order], vs[order]
 
-    for u, v, d in g.edges.data('weight'):
-        base_u = voronoi.bases[u]
-        base_v = voronoi.bases[v]
+    is_start = np.ones(len(a), dtype=bool)
+    is_start[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    starts = np.flatnonzero(is_start)
 
-        # Skip non-boundary edges
-        if base_u == base_v:
-            continue
+    weights = np.minimum.reduceat(costs, starts)
+    order = starts[np.argsort(weights, kind='stable')]
+
+    return list(zip(costs[order].tolist(), a[order].tolist(), b[order].tolist(),
+                    us[order].tolist(), vs[order].tolist()))
+
+
+class DistanceNetwork:
+    """
+    The auxiliary graph of G w.r.t. a set of centers, together with the Voronoi
+    diagram it is built from. A center can be removed tentatively: only its cell
+    is repaired and only the auxiliary edges incident to the repaired vertices
+    are computed again. As for the Voronoi diagram, the removals are recorded,
+    and rollback() restores the network of all the centers.
+
+    The auxiliary edges of all the centers are kept sorted by weight, the edges
+    found after the removals are merged into them when computing the MST. The
+    edges of the removed centers are skipped, and the edges made redundant by
+    a cheaper edge between the same centers are rejected by Kruskal's algorithm.
+    """
+    def __init__(self, g, centers):
+        self.g = g
+        self.voronoi = VoronoiDiagram(g, centers)
+        self.n_centers = len(set(centers))
+        self.edges = auxiliary_edges(g, self.voronoi)
+        self.removed = []
+        self.new_edges = []
+
+    def remove_center(self, center):
+        """
+        Remove a center from the auxiliary graph.
+        """
+        g, voronoi = self.g, self.voronoi
+        self.removed.append(center)
 
-        # Add the edge (base_u, base_v) to the auxiliary graph
-        # if it was not already added
-        if (base_u, base_v) not in aux.edges:
-            aux.add_edge(base_u, base_v)
+        # The auxiliary edges of the other centers do not change, except for
+        # the boundary edges incident to the vertices of the removed cell
+        for u in voronoi.remove_center(g, center):
+            base_u = int(voronoi.bases[u])
 
-        cost_uv = boundary_edge_cost((u, v), d, voronoi)
+            for v, weight in zip(*g.adjacency(u)):
+                base_v = int(voronoi.bases[v])
 
-        # Update the weight and the boundary edge between two centers if
-        # the boundary edge cost is smaller than the current weight
-        if cost_uv < aux.edges[base_u, base_v].get('weight', float('inf')):
-            aux.edges[base_u, base_v]['weight'] = cost_uv
-            aux.edges[base_u, base_v]['boundary_edge'] = (u, v)
+                # Skip non-boundary edges
+                if base_u == base_v:
+                    continue
 
-    return aux
+                cost_uv = boundary_edge_cost((u, v), weight, voronoi)
+                self.new_edges.append((float(cost_uv), base_u, base_v, u, v))
+
+    def rollback(self):
+        """
+        Restore the centers removed since the last rollback.
+        """
+        self.removed = []
+        self.new_edges = []
+        self.voronoi.rollback()
+
+    def steiner_tree(self):
+        """
+        Compute the MST of the auxiliary graph, then expand its
+        edges to obtain a tree in G.
+        """
+        removed = set(self.removed)
+        n_edges = self.n_centers - len(removed) - 1
+        edge_container = []  # container for the edges of the Steiner tree
+
+        subtrees = UnionFind()
+        for _, base_u, base_v, u, v in heapq.merge(self.edges, sorted(self.new_edges)):
+            if len(edge_container) >= n_edges:
+                break
+
+            if base_u in removed or base_v in removed:
+                continue
+
+            if subtrees[base_u] != subtrees[base_v]:
+                subtrees.union(base_u, base_v)
+
+                # The path from base(u) to base(v) in the mst
+                path = base_path(u, v, self.voronoi)
+
+                # Add the edges from the path to the container
+                edge_container.append(pairwise(path))
+
+        # The tree is formed by joining all the edges found above
+        return self.g.edge_subgraph(chain.from_iterable(edge_container))
 
 
 def distance_network_heuristics(g, terminals):
@@ -189,24 +361,53 @@ def distance_network_heuristics(g, terminals):
     The algorithm computes the MST of the auxiliary graph of G w.r.t.
     the terminals, then expands its edges to obtain a tree in G.
     """
+    return DistanceNetwork(g, terminals).steiner_tree()
+
+
+def mehlhorn(g, terminals):
+    """
+    Mehlhorn's variant of DNH: the boundary edges of the Voronoi diagram of
+    the terminals are streamed in the order of their costs into a union-find
+    on the bases, which is Kruskal's algorithm on the auxiliary graph without
+    constructing it. The ties are broken as in auxiliary_edges, thus the tree
+    found is the same as the one of DNH.
+    """
     voronoi = VoronoiDiagram(g, terminals)
-    aux = auxiliary_graph(g, voronoi)
-    mst = nx.minimum_spanning_tree(aux)
+    a, b, costs, us, vs = boundary_edges(g, voronoi)
+    order = np.lexsort((b, a, costs))
+
+    n_edges = len(set(terminals)) - 1
     edge_container = []  # container for the edges of the Steiner tree
 
-    for _, _, (u, v) in mst.edges.data('boundary_edge'):
-        # The path from base(u) to base(v) in the mst
-        path = base_path(u, v, voronoi)
+    subtrees = UnionFind()
+    for base_u, base_v, u, v in zip(a[order].tolist(), b[order].tolist(),
+                                    us[order].tolist(), vs[order].tolist()):
+        if len(edge_container) >= n_edges:
+            break
 
-        # Add the edges from the path to the container
-        edge_container.append(pairwise(path))
+        if subtrees[base_u] != subtrees[base_v]:
+            subtrees.union(base_u, base_v)
+            edge_container.append(pairwise(base_path(u, v, voronoi)))
 
-    # The DNH is formed by joining all the edges found above
-    dnh = nx.Graph(g.edge_subgraph(
-        chain.from_iterable(edge_container)
-    ))
+    # The tree is formed by joining all the edges found above
+    return g.edge_subgraph(chain.from_iterable(edge_container))
 
-    return dnh
+
+def walk_key_path(tree, u, w, crucial_vertices):
+    """
+    Walk along the key path starting from the crucial vertex u with
+    the edge (u, w), until we reach the next crucial vertex.
+    """
+    path = [u, w]
+
+    # The non-crucial vertices of the tree have degree 2,
+    # thus there is only one way to continue the walk
+    while w not in crucial_vertices:
+        x, y = tree[w]
+        w = y if x == path[-2] else x
+        path.append(w)
+
+    return path
 
 
 def find_key_paths(g, crucial_vertices):
@@ -217,141 +418,209 @@ def find_key_paths(g, crucial_vertices):
     of key vertices, which are non-terminal and degree at least 3,
     T is the set of terminals, which covers all leaves. Thus the set of
     key paths partitions the edges of the graph G.
+
+    The key paths are found by a single traversal of the tree: from each
+    crucial vertex reached, we walk along each unvisited edge until the
+    next crucial vertex, which is then explored in turn.
     """
     key_paths = []
 
-    # Given a tree, the path from a leaf to the nearest key vertex
-    # is a key path, thus we start from a leaf, repeatedly prune
-    # edges until we reach a key vertex
+    roots = (node for node in g.nodes if node in crucial_vertices)
+    root = next(roots, None)
+    if root is None:
+        return key_paths
 
-    def prune(tree):
-        leaves = [node for node in tree.nodes if tree.degree(node) == 1]
-        assert set(leaves).issubset(crucial_vertices)
+    visited = {root}
+    stack = [root]
 
-        for v in leaves:
-            path = [v]
-            while True:
-                v_neighbors = list(nx.all_neighbors(tree, v))
-                if not v_neighbors:
-                    # Now v is the last vertices in the tree,
-                    # we return an empty graph to end the loop
-                    return nx.Graph()
+    while stack:
+        u = stack.pop()
 
-                w = v_neighbors[0]
-                tree.remove_node(v)
-                path.append(w)
-                v = w
+        for w in g[u]:
+            # In a tree, the only visited neighbor of u
+            # is on the key path we came from
+            if w in visited:
+                continue
 
-                # Stop pruning if we reach a key vertex
-                if w in crucial_vertices:
-                    break
+            path = walk_key_path(g, u, w, crucial_vertices)
+            visited.update(path[1:])
+            stack.append(path[-1])
 
             key_paths.append(path)
 
-        return tree
+    return key_paths
 
-    # Repeatedly prune the tree to find key paths, until there is no edges left
-    t = g.copy()
-    while t.edges:
-        t = prune(t)
 
-    return key_paths
+class KeyPathIndex:
+    """
+    The key paths of a solution S, maintained incrementally when a key path is
+    replaced by another path in S. Only the key paths around the vertices whose
+    degrees changed are removed, then rediscovered by walking from their ends.
+    """
+    def __init__(self, s, terminals):
+        self.terminals = terminals
+        self.crucial_vertices = {node for node in s.nodes
+                                 if s.degree(node) >= 3 or node in terminals}
 
+        self.paths = {}  # id -> key path
+        self.path_of_edge = {}  # edge, in both orientations -> id of its key path
+        self.next_id = 0
 
-def replace_path(g, s, old_path, new_path):
-    new_s = s.copy()
+        for path in find_key_paths(s, self.crucial_vertices):
+            self._add(path)
 
-    # Remove path edges
-    new_s.remove_edges_from(pairwise(old_path))
+    def __iter__(self):
+        return iter(list(self.paths.values()))
 
-    # Remove internal vertices
-    new_s.remove_nodes_from(old_path[1:-1])
+    def __len__(self):
+        return len(self.paths)
 
-    # Add the edges from new_path
-    new_s.add_weighted_edges_from((u, v, g.edges[u, v]['weight'])
-                                  for u, v in pairwise(new_path))
+    def _add(self, path):
+        i = self.next_id
+        self.next_id += 1
 
-    return new_s
+        self.paths[i] = path
+        for u, v in pairwise(path):
+            self.path_of_edge[u, v] = self.path_of_edge[v, u] = i
 
+    def _remove(self, i):
+        path = self.paths.pop(i)
+        for u, v in pairwise(path):
+            del self.path_of_edge[u, v]
+            del self.path_of_edge[v, u]
 
-def key_path_exchange(g, s, terminals, early_stop=True):
-    """
-    Determine whether it is possible to remove some key path and reconnect
-    the two resulting components more cheaply.
+        return path
 
-    Initially, we have the Voronoi diagram with all vertices in S as bases.
-    By removing a key path in S, we remove all the Voronoi cells with bases
-    are vertices on the key path. Then repair the Voronoi diagram. After that,
-    we proceed to find the best boundary edge re-connect the two components
-    of S to obtain a new solution.
+    def replace(self, s, old_path, new_path):
+        """
+        Update the key paths after replacing old_path by new_path,
+        where s is the solution after the replacement.
+        """
+        self._remove(self.path_of_edge[old_path[0], old_path[1]])
+
+        # Only the ends of the two paths change their degrees, thus their
+        # crucial status. We remove the key paths through them, and walk
+        # again from the ends of these key paths.
+        changed_vertices = {old_path[0], old_path[-1], new_path[0], new_path[-1]}
+        starts = set(changed_vertices)
+
+        for x in changed_vertices:
+            if s.degree(x) >= 3 or x in self.terminals:
+                self.crucial_vertices.add(x)
+            else:
+                self.crucial_vertices.discard(x)
+
+            for w in s[x]:
+                i = self.path_of_edge.get((x, w))
+                if i is not None:
+                    path = self._remove(i)
+                    starts.update((path[0], path[-1]))
+
+        for u in starts & self.crucial_vertices:
+            for w in s[u]:
+                if (u, w) not in self.path_of_edge:
+                    self._add(walk_key_path(s, u, w, self.crucial_vertices))
+
+
+def best_key_path_exchange(g, tree, s_weight, terminals, key_paths, early_stop=True,
+                           deadline=Deadline()):
     """
-    crucial_vertices = {node for node in s.nodes
-                        if s.degree(node) >= 3 or node in terminals}
-
-    key_paths = find_key_paths(s, crucial_vertices)
-    voronoi = VoronoiDiagram(g, s.nodes)
+    Find the best exchange of a key path of S, given by its tree, among
+    key_paths. Return the decrease in the weight of S with the key path
+    to remove and the path to add, or None if there is no improvement,
+    together with the key paths which do not improve S, as tuples.
+    """
+    voronoi = VoronoiDiagram(g, tree.nodes)
 
     diff = 0
-    key_path_to_del = None
-    key_path_to_add = None
+    best_move = None
+    clean = []
 
     for key_path in key_paths:
-        key_path_weight = sum(g.edges[e]['weight'] for e in pairwise(key_path))
+        if deadline.expired():
+            break
 
-        temp_voronoi = voronoi.copy()
+        key_path_weight = sum(tree.edges[e]['weight'] for e in pairwise(key_path))
 
         # Temporarily remove the key path from the current solution, together
         # with the associated Voronoi cells, we need to repair the diagram
         # to find the partition formed by the two components of S
-        s1, s2 = temp_voronoi.repair(g, s, key_path)
+        s1, s2 = voronoi.repair(g, tree, key_path)
+
+        # Now s1 and s2 form a partition of V_G, we look for
+        # the best boundary edge to reconnect the two components
+        boundary_edge, cost = best_boundary_edge(g, voronoi, s1, s2)
 
-        # Now s1 and s2 form a partition of V_G, we iterate over
-        # the boundary edges to look for an improvement
-        best_boundary_edge, cost = min(((e, boundary_edge_cost(e, g.edges[e]['weight'], temp_voronoi))
-                                        for e in nx.edge_boundary(g, s1, s2)),
-                                       key=lambda x: x[1])
+        best_path = base_path(*boundary_edge, voronoi)
 
-        best_path = base_path(*best_boundary_edge, temp_voronoi)
+        # Restore the diagram of S for the next key path
+        voronoi.rollback()
 
-        if cost < key_path_weight:
+        if cost >= key_path_weight:
+            clean.append(tuple(key_path))
+        else:
             # Find the best improvement to make
             new_diff = key_path_weight - cost
             if new_diff > diff:
                 diff = new_diff
-                key_path_to_del = key_path
-                key_path_to_add = best_path
+                best_move = (diff, (key_path, best_path))
 
             if early_stop:
                 # Break the loop to return immediately,
                 # without looking for the best improvement
                 break
 
-    # No improvement was found, we return the unmodified solution
-    if key_path_to_add is None:
-        return s
+    return best_move, clean
 
-    return replace_path(g, s, key_path_to_del, key_path_to_add)
 
+def key_path_exchange(g, s, terminals, early_stop=True, deadline=Deadline()):
+    """
+    Determine whether it is possible to remove some key path and reconnect
+    the two resulting components more cheaply.
+
+    Initially, we have the Voronoi diagram with all vertices in S as bases.
+    By removing a key path in S, we remove all the Voronoi cells with bases
+    are vertices on the key path. Then repair the Voronoi diagram. After that,
+    we proceed to find the best boundary edge re-connect the two components
+    of S to obtain a new solution.
 
-def key_vertex_elimination(g, s, terminals, early_stop=True):
+    S is a Solution, the key paths are maintained by S between the calls,
+    and the best improvement is applied to S in place.
     """
-    Determine if there is a key vertex v such that the solution S' associated
-    with C' = C \ {v} is cheaper, with C is the set of crucial vertices.
+    best_move = s.best_move('key_path_exchange', best_key_path_exchange, s.key_paths,
+                            early_stop, deadline, paths=True)
+
+    # Apply the best improvement found, if any
+    if best_move is not None:
+        s.replace_path(*best_move[1])
+
+    return s
+
 
-    The solution is found by applying DNH to C' for each removal.
+def best_key_vertex_elimination(g, tree, s_weight, terminals, key_vertices, early_stop=True,
+                                deadline=Deadline()):
     """
-    key_vertices = {node for node in s.nodes
-                    if s.degree(node) >= 3 and node not in terminals}
-    s_weight = graph_weight(s)
+    Find the best removal of a key vertex of S, given by its tree and its
+    weight, among key_vertices. Return the decrease in the weight of S with
+    the edges of the new solution, or None if there is no improvement,
+    together with the key vertices which do not improve S.
+    """
+    crucial_vertices = {node for node in tree.nodes
+                        if tree.degree(node) >= 3 or node in terminals}
     diff = 0
     best_s = None
+    clean = []
+
+    network = DistanceNetwork(g, crucial_vertices)
 
     for key_vertex in key_vertices:
-        k = key_vertices.copy()
-        k.remove(key_vertex)
+        if deadline.expired():
+            break
 
         # Find the solution associated to C \ {v}
-        new_s = distance_network_heuristics(g, k | terminals)
+        network.remove_center(key_vertex)
+        new_s = network.steiner_tree()
+        network.rollback()
 
         # We need to prune the solution, as there are non-terminals
         # in the distance network vertices
@@ -359,29 +628,69 @@ def key_vertex_elimination(g, s, terminals, early_stop=True):
 
         new_s_weight = graph_weight(new_s)
 
-        if new_s_weight < s_weight:
-            if early_stop:
-                # Return the better solution as soon as we find one
-                return new_s
-
+        if new_s_weight >= s_weight:
+            clean.append(key_vertex)
+        else:
             # Find the best improvement to make
             new_diff = s_weight - new_s_weight
             if new_diff > diff:
                 diff = new_diff
                 best_s = new_s
 
-    # No improvement was found, we return the unmodified solution
+            if early_stop:
+                # Use the better solution as soon as we find one
+                break
+
     if best_s is None:
-        return s
+        return None, clean
 
-    return best_s
+    return (diff, list(best_s.edges.data('weight'))), clean
 
 
-def local_search(g, s, terminals, early_stop=True):
-    from .steiner_vertices import steiner_vertices_insertion
+def key_vertex_elimination(g, s, terminals, early_stop=True, deadline=Deadline()):
+    """
+    Determine if there is a key vertex v such that the solution S' associated
+    with C' = C \ {v} is cheaper, with C is the set of crucial vertices.
+
+    The solution is found by applying DNH to C' for each removal. The distance
+    network of C is shared between the removals: removing v only repairs the
+    Voronoi cell of v and the auxiliary edges around it, before rerunning
+    the MST on the auxiliary graph.
+
+    S is a Solution, which is replaced in place by the best solution found.
+    """
+    best_move = s.best_move('key_vertex_elimination', best_key_vertex_elimination,
+                            s.key_vertices, early_stop, deadline)
 
-    s = steiner_vertices_insertion(g, s, terminals, early_stop=early_stop)
-    s = key_vertex_elimination(g, s, terminals, early_stop=early_stop)
-    s = key_path_exchange(g, s, terminals, early_stop=early_stop)
+    # Apply the best improvement found, if any
+    if best_move is not None:
+        best_s = nx.Graph()
+        best_s.add_weighted_edges_from(best_move[1])
+        s.replace_tree(best_s, s.weight - best_move[0])
 
     return s
+
+
+def neighborhood_descent():
+    """
+    A VND over the neighborhoods of the Steiner vertex insertion,
+    the key vertex elimination and the key path exchange.
+    """
+    from .steiner_vertices import steiner_vertices_insertion
+
+    return VariableNeighborhoodDescent([steiner_vertices_insertion, key_vertex_elimination,
+                                        key_path_exchange])
+
+
+def local_search(g, s, terminals, early_stop=True, deadline=Deadline(), vnd=None):
+    """
+    Apply the neighborhoods of the Steiner vertex insertion, the key vertex
+    elimination and the key path exchange until S is a local optimum for all
+    of them, the most promising neighborhoods first. The VND given by
+    neighborhood_descent() keeps the statistics of the neighborhoods between
+    the calls, a new one is used if it is not provided.
+    """
+    if vnd is None:
+        vnd = neighborhood_descent()
+
+    return vnd.run(g, s, terminals, early_stop=early_stop, deadline=deadline)
@@ -0,0 +1,239 @@
+class LinkCutTree:
+    """
+    A link-cut tree (Sleator and Tarjan) over a forest with weighted edges.
+    It supports linking two trees by an edge, cutting an edge, and finding
+    the heaviest edge on the path between two vertices, all in amortized
+    O(log n) time.
+
+    Each edge is represented by an extra node carrying the weight of the edge,
+    so that the heaviest edge on a path is the heaviest node on the path of the
+    represented tree. The nodes are stored in flat lists indexed by slots, the
+    vertices of the forest are mapped to their slots in the dict slots.
+
+    The links and cuts are recorded in a journal, so that rollback() restores
+    the forest it was built from. The insertions are only evaluated on the
+    forest, thus the callers always roll their changes back.
+    """
+
+    def __init__(self, tree=None):
+        self.left = []
+        self.right = []
+        self.parent = []
+        self.flip = []
+        self.weight = []
+        self.best = []  # the slot of the heaviest node in the splay subtree
+
+        self.slots = {}  # vertex -> slot
+        self.edges = {}  # (u, v) -> slot of the edge node, for both orientations
+        self.edge_of = {}  # slot of an edge node -> (u, v)
+        self.free = []  # the slots of the cut edges, to be reused
+        self.journal = []
+
+        if tree is not None:
+            for u in tree.nodes:
+                self.add_node(u)
+
+            for u, v, w in tree.edges.data('weight'):
+                self._link_edge(u, v, w)
+
+    def _new_slot(self, weight):
+        if self.free:
+            x = self.free.pop()
+            self.left[x] = self.right[x] = self.parent[x] = -1
+            self.flip[x] = False
+            self.weight[x] = weight
+            self.best[x] = x
+            return x
+
+        x = len(self.left)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.parent.append(-1)
+        self.flip.append(False)
+        self.weight.append(weight)
+        self.best.append(x)
+
+        return x
+
+    def add_node(self, u):
+        if u not in self.slots:
+            self.slots[u] = self._new_slot(float('-inf'))
+
+    def __contains__(self, u):
+        return u in self.slots
+
+    def _is_root(self, x):
+        """
+        Whether x is the root of its splay tree.
+        """
+        p = self.parent[x]
+        return p == -1 or (self.left[p] != x and self.right[p] != x)
+
+    def _push(self, x):
+        if self.flip[x]:
+            left, right = self.left[x], self.right[x]
+            self.left[x], self.right[x] = right, left
+
+            if left != -1:
+                self.flip[left] = not self.flip[left]
+            if right != -1:
+                self.flip[right] = not self.flip[right]
+
+            self.flip[x] = False
+
+    def _update(self, x):
+        best = x
+        weight = self.weight
+
+        for c in (self.left[x], self.right[x]):
+            if c != -1 and weight[self.best[c]] > weight[best]:
+                best = self.best[c]
+
+        self.best[x] = best
+
+    def _rotate(self, x):
+        p = self.parent[x]
+        g = self.parent[p]
+
+        if not self._is_root(p):
+            if self.left[g] == p:
+                self.left[g] = x
+            else:
+                self.right[g] = x
+
+        if self.left[p] == x:
+            child = self.right[x]
+            self.left[p] = child
+            self.right[x] = p
+        else:
+            child = self.left[x]
+            self.right[p] = child
+            self.left[x] = p
+
+        if child != -1:
+            self.parent[child] = p
+
+        self.parent[p] = x
+        self.parent[x] = g
+
+        self._update(p)
+        self._update(x)
+
+    def _splay(self, x):
+        # Push the pending flips from the root of the splay tree down to x
+        stack = [x]
+        y = x
+        while not self._is_root(y):
+            y = self.parent[y]
+            stack.append(y)
+
+        for y in reversed(stack):
+            self._push(y)
+
+        while not self._is_root(x):
+            p = self.parent[x]
+
+            if not self._is_root(p):
+                g = self.parent[p]
+                if (self.left[g] == p) == (self.left[p] == x):
+                    self._rotate(p)
+                else:
+                    self._rotate(x)
+
+            self._rotate(x)
+
+    def _access(self, x):
+        """
+        Make the path from the root of the represented tree to x preferred,
+        and x the root of its splay tree.
+        """
+        last = -1
+        y = x
+
+        while y != -1:
+            self._splay(y)
+            self.right[y] = last
+            self._update(y)
+            last = y
+            y = self.parent[y]
+
+        self._splay(x)
+
+    def _make_root(self, x):
+        self._access(x)
+        self.flip[x] = not self.flip[x]
+
+    def _link(self, x, y):
+        self._make_root(x)
+        self.parent[x] = y
+
+    def _cut(self, x, y):
+        self._make_root(x)
+        self._access(y)
+
+        # Now x is the left child of y, without right child
+        self.left[y] = -1
+        self.parent[x] = -1
+        self._update(y)
+
+    def link(self, u, v, weight):
+        """
+        Add the edge (u, v) with the given weight, u and v must be in different trees.
+        """
+        self.journal.append((True, u, v, weight))
+        self._link_edge(u, v, weight)
+
+    def cut(self, u, v):
+        """
+        Remove the edge (u, v).
+        """
+        self.journal.append((False, u, v, self.weight[self.edges[u, v]]))
+        self._cut_edge(u, v)
+
+    def rollback(self):
+        """
+        Undo the links and cuts recorded in the journal.
+        """
+        for linked, u, v, weight in reversed(self.journal):
+            if linked:
+                self._cut_edge(u, v)
+            else:
+                self._link_edge(u, v, weight)
+
+        self.journal = []
+
+    def _link_edge(self, u, v, weight):
+        self.add_node(u)
+        self.add_node(v)
+
+        e = self._new_slot(weight)
+        self.edges[u, v] = self.edges[v, u] = e
+        self.edge_of[e] = (u, v)
+
+        self._link(self.slots[u], e)
+        self._link(e, self.slots[v])
+
+    def _cut_edge(self, u, v):
+        e = self.edges.pop((u, v))
+        del self.edges[v, u]
+        del self.edge_of[e]
+
+        self._cut(self.slots[u], e)
+        self._cut(e, self.slots[v])
+        self.free.append(e)
+
+    def path_max(self, u, v):
+        """
+        Find the heaviest edge on the path connecting u and v, which must be
+        in the same tree. Return the edge and its weight, or None if u = v.
+        """
+        x, y = self.slots[u], self.slots[v]
+        if x == y:
+            return None
+
+        self._make_root(x)
+        self._access(y)
+
+        e = self.best[y]
+
+        return self.edge_of[e], self.weight[e]
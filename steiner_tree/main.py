@@ -7,11 +7,13 @@ import os
 import time
 from functools import wraps
 
-import interruptingcow as ic
-import networkx as nx
-
-from . import steiner_vertices, key_paths
-from .utils import parse_graph, graph_weight
+from . import parallel, steiner_vertices, key_paths
+from .iterated_local_search import IteratedLocalSearch
+from .portfolio import Portfolio
+from .reduction import Reduction
+from .solution import Solution
+from .utils import (SHORTEST_PATH_BACKENDS, Deadline, find_starting_solution, instance_size,
+                    parse_graph, read_solution, set_shortest_path_backend, write_solution)
 
 METHODS = {'kv': key_paths, 'sv': steiner_vertices}
 
@@ -58,45 +60,46 @@ def log_error(f):
     return wrapper
 
 
-class NullContextManager:
-    """
-    Dummy Context Manager to use as a replacement for interruptingcow.timeout
-    in the case no timeout was specified.
-    """
-
-    def __init__(self, *args, **kwargs):
-        pass
-
-    def __enter__(self, *args, **kwargs):
-        pass
-
-    def __exit__(self, *args, **kwargs):
-        pass
-
-
 @log_error
 def solve(instance_id, args):
     start_all = time.time()
     print("Start solving #{} in Process #{}".format(instance_id, os.getpid()))
 
     method = METHODS[args.method]
+    set_shortest_path_backend(args.backend)
 
     if args.verbose:
         print('Parsing instance #{}...'.format(instance_id))
 
     g, terminals = parse_graph(instance_id)
 
-    # Parse the precomputed starting solution
-    s = nx.read_gpickle('results/starting_solutions/{}/{}.gpickle'.format(
-        args.start, instance_id
-    ))
-
-    s_weight = graph_weight(s)
-
     if args.verbose:
         print('G has {} nodes, {} edges, {} terminals.'.format(
-            len(g.nodes), len(g.edges), len(terminals)
+            g.number_of_nodes(), g.number_of_edges(), len(terminals)
         ))
+
+    if args.reduce:
+        # Run the local search on the reduced graph, the precomputed starting
+        # solutions are for the original graph, thus we compute a new one
+        reduction = Reduction(g, terminals)
+        g, terminals = reduction.graph, reduction.terminals
+        s = Solution(g, find_starting_solution(g, terminals, algo=args.start), terminals)
+
+        if args.verbose:
+            print('The reduced graph has {} nodes, {} edges.'.format(
+                g.number_of_nodes(), g.number_of_edges()
+            ))
+    else:
+        reduction = None
+
+        # Parse the precomputed starting solution
+        s = Solution(g, read_solution(g, 'results/starting_solutions/{}/{}.npy'.format(
+            args.start, instance_id
+        )), terminals)
+
+    s_weight = s.weight
+
+    if args.verbose:
         print('The starting solution has {} nodes with the total weight of {}.'.format(
             len(s.nodes), s_weight
         ))
@@ -106,58 +109,203 @@ def solve(instance_id, args):
     epoch_times = []
     total_time = 0
 
-    # Setup the timeout
-    context_manager = NullContextManager if args.timeout == 0 else ic.timeout
+    # The local search stops cooperatively at the deadline,
+    # with the best solution found so far
+    deadline = Deadline(args.timeout)
+    time_to_best = time.time() - start_all
+
+    # The VND of all the local searches below, with the statistics of the neighborhoods
+    vnd = method.neighborhood_descent()
+
+    if args.portfolio > 1:
+        # Solve with several configurations in parallel, stopping early to
+        # leave a tenth of the time to confirm the best solution below
+        portfolio = Portfolio(g, terminals, args.portfolio, seed=args.seed,
+                              early_stop=args.early_stop)
+        s = portfolio.run(Deadline(0.9 * args.timeout),
+                          max_stall=None if args.timeout else 100)
+
+        if s.weight < s_weight:
+            if args.verbose:
+                print("Portfolio: the solution weight improves from {} to {}.".format(
+                    s_weight, s.weight
+                ))
+
+            s_weight = s.weight
+            weights.append(s_weight)
+            time_to_best = portfolio.best_time - start_all
+
+        # The workers can run past their deadline, which is only checked between
+        # the candidates, thus the best solution is confirmed to be a local
+        # optimum by one local search without time limit
+        method.local_search(g, s, terminals, early_stop=args.early_stop, vnd=vnd)
+
+        if s.weight < s_weight:
+            if args.verbose:
+                print("Portfolio: the local search improves the solution weight "
+                      "from {} to {}.".format(s_weight, s.weight))
+
+            s_weight = s.weight
+            weights.append(s_weight)
+            time_to_best = time.time() - start_all
+
+    if args.jobs > 1:
+        # Share G with the workers evaluating the neighborhoods
+        parallel.start(g, args.jobs)
 
     try:
-        with context_manager(args.timeout, TimeoutError):
-            while True:
-                epoch += 1
-                start = time.time()
+        while True:
+            epoch += 1
+            start = time.time()
+
+            if args.verbose:
+                print("Epoch {}:".format(epoch), end=' ', flush=True)
+
+            # The local search modifies the solution in place
+            method.local_search(g, s, terminals, early_stop=args.early_stop, deadline=deadline,
+                                vnd=vnd)
+            new_s_weight = s.weight
+            epoch_time = round(time.time() - start, 3)
 
+            if new_s_weight < s_weight:
+                if args.verbose:
+                    print("The solution weight improves from {} to {}.".format(
+                        s_weight, new_s_weight
+                    ))
+
+                s_weight = new_s_weight
+                time_to_best = time.time() - start_all
+            elif deadline.expired():
+                print('Stop solving #{} due to timeout.'.format(instance_id))
+                break
+            else:
                 if args.verbose:
-                    print("Epoch {}:".format(epoch), end=' ', flush=True)
-
-                new_s = method.local_search(g, s, terminals,
-                                            early_stop=args.early_stop)
-                new_s_weight = graph_weight(new_s)
-                epoch_time = round(time.time() - start, 3)
-
-                if new_s_weight < s_weight:
-                    if args.verbose:
-                        print("The solution weight improves from {} to {}.".format(
-                            s_weight, new_s_weight
-                        ))
-
-                    s_weight = new_s_weight
-                    s = new_s.copy()
-                else:
-                    if args.verbose:
-                        print("The solution weight does not improve, "
-                              "returning the solution.")
-                    break
-
-                weights.append(new_s_weight)
-                epoch_times.append(epoch_time)
-                total_time += epoch_time
-    except TimeoutError:
-        print('Stop solving #{} due to timeout.'.format(instance_id))
+                    print("The solution weight does not improve, "
+                          "returning the solution.")
+                break
+
+            weights.append(new_s_weight)
+            epoch_times.append(epoch_time)
+            total_time += epoch_time
+
+            if deadline.expired():
+                print('Stop solving #{} due to timeout.'.format(instance_id))
+                break
+
+        ils = None
+        if args.ils and not deadline.expired():
+            # Use the remaining time to escape from the local optimum
+            ils = IteratedLocalSearch(g, terminals, method, seed=args.seed,
+                                      early_stop=args.early_stop, vnd=vnd)
+            s = ils.run(s, deadline, max_stall=None if args.timeout else 100)
+
+            for improvement_time, new_s_weight in ils.history:
+                if args.verbose:
+                    print("Iterated local search: the solution weight improves to {}.".format(
+                        new_s_weight
+                    ))
+
+                time_to_best = improvement_time - start_all
+
+            if args.verbose:
+                print("Iterated local search: {} iterations.".format(ils.n_iterations))
+    finally:
+        parallel.stop()
 
     if args.verbose:
+        for neighborhood in vnd.neighborhoods:
+            print('{}: {} calls, hit rate {:.2f}, {:.3f} seconds per call.'.format(
+                neighborhood.__name__, vnd.calls[neighborhood],
+                vnd.hit_rate(neighborhood), vnd.cost(neighborhood)
+            ))
+
         print('The final solution has {} nodes.'.format(
             len(s.nodes)
         ))
 
     if args.save:
-        nx.write_gpickle(s, 'results/{}/{}.gpickle'.format(
+        tree = s.tree
+        if reduction is not None:
+            # Expand the solution to the original graph
+            tree = reduction.expand(tree)
+            g = reduction.g
+
+        write_solution(g, tree, 'results/{}/{}.npy'.format(
             get_name(args), instance_id
         ))
 
     end_all = time.time()
     run_time = end_all - start_all
-    print('Solved #{} after {} seconds'.format(instance_id, round(run_time, 3)))
+    print('Solved #{} after {} seconds, the best solution was found after {} seconds'.format(
+        instance_id, round(run_time, 3), round(time_to_best, 3)
+    ))
+
+    result = {'weights': weights, 'epoch_times': epoch_times,
+              'run_time': run_time, 'time_to_best': time_to_best}
+
+    if ils is not None:
+        result['ils'] = {'weights': [weight for _, weight in ils.history],
+                         'iterations': ils.n_iterations}
+
+    return {str(instance_id): result}
+
+
+def run_task(instance_id, args):
+    """
+    Solve an instance in a worker of the pool, and return the result
+    together with the worker and the time it was busy solving.
+    """
+    start = time.time()
+    result = solve(instance_id, args)
+
+    return os.getpid(), time.time() - start, result
+
+
+def estimate_costs(instances, results):
+    """
+    Estimate the time to solve each instance. For the instances already solved
+    with the same options, this is the recorded run time. For the others, this
+    is the number of edges times the number of terminals, scaled by the median
+    ratio of the run times to this product over the solved instances. The
+    instances whose size cannot be read come last, their errors are logged
+    when they are solved.
+    """
+    costs = {}
+    ratios = []
+
+    for instance_id in instances:
+        size = instance_size(instance_id)
+        costs[instance_id] = size[0] * size[1] if size else 0
+
+        result = results.get(str(instance_id))
+        if result and costs[instance_id]:
+            ratios.append(result['run_time'] / costs[instance_id])
+
+    ratios.sort()
+    ratio = ratios[len(ratios) // 2] if ratios else 1
+
+    for instance_id in instances:
+        result = results.get(str(instance_id))
+        if result:
+            costs[instance_id] = result['run_time']
+        else:
+            costs[instance_id] *= ratio
+
+    return costs
+
+
+def report_utilisation(busy_times, n_processes, elapsed_time):
+    """
+    Print the time each worker spent solving, relative to the elapsed time.
+    """
+    print('Worker utilisation:')
+    for pid, (n_tasks, busy_time) in sorted(busy_times.items()):
+        print('  Process #{}: {} instances, busy {:.1f}s ({:.0%})'.format(
+            pid, n_tasks, busy_time, busy_time / elapsed_time
+        ))
 
-    return {str(instance_id): {'weights': weights, 'epoch_times': epoch_times, 'run_time': run_time}}
+    total = sum(busy_time for _, busy_time in busy_times.values())
+    print('  Overall: {:.0%} of {} processes'.format(total / (n_processes * elapsed_time), n_processes))
 
 
 def get_name(args):
@@ -172,6 +320,18 @@ def get_name(args):
     if not args.early_stop:
         name += '_noearly'
 
+    if args.reduce:
+        name += '_reduced'
+
+    if args.backend != 'heap':
+        name += '_{}'.format(args.backend)
+
+    if args.ils:
+        name += '_ils{}'.format(args.seed)
+
+    if args.portfolio > 1:
+        name += '_portfolio{}'.format(args.portfolio)
+
     if args.timeout:
         name += '_{}'.format(args.timeout)
 
@@ -189,6 +349,17 @@ def check_args(parser, args):
         parser.error("Can turn on verbosity mode if and only if "
                      "a single instance id is provided with --id.")
 
+    if args.jobs > 1 and (args.id is None or len(args.id) != 1):
+        parser.error("Can evaluate the neighborhoods in parallel if and only if "
+                     "a single instance id is provided with --id.")
+
+    if args.portfolio > 1 and (args.id is None or len(args.id) != 1):
+        parser.error("Can use a portfolio if and only if "
+                     "a single instance id is provided with --id.")
+
+    if args.portfolio > 1 and args.jobs > 1:
+        parser.error("Cannot use --portfolio and --jobs at the same time.")
+
     if args.id is not None and not all(1 <= iid <= 199 and iid % 2
                                        for iid in args.id):
         parser.error("The instance id provided need to be odd numbers "
@@ -200,7 +371,7 @@ def check_args(parser, args):
 def parse_args():
     parser = argparse.ArgumentParser(description='Use local search to solve the '
                                                  'Steiner tree problem.')
-    parser.add_argument('-s', '--start', choices=('dnh', 'mst'), default='dnh',
+    parser.add_argument('-s', '--start', choices=('dnh', 'mst', 'mehlhorn'), default='dnh',
                         help="The choice of algorithm to find the starting solution. "
                              "Default: '%(default)s'.")
     parser.add_argument('-m', '--method', choices=('kv', 'sv'), default='kv',
@@ -209,6 +380,20 @@ def parse_args():
                              "steiner vertices. Default: '%(default)s'.")
     parser.add_argument('-n', '--no-early-stop', dest='early_stop', action='store_false',
                         help="Do not use early stopping by default in the local search.")
+    parser.add_argument('-r', '--reduce', action='store_true',
+                        help="Reduce the graph with classical reduction tests "
+                             "before the local search.")
+    parser.add_argument('--ils', action='store_true',
+                        help="After reaching a local optimum, continue with an iterated "
+                             "local search perturbing the weights of the graph until "
+                             "the timeout.")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="The seed of the random perturbations of the iterated local "
+                             "search. Default: %(default)s.")
+    parser.add_argument('-b', '--backend', choices=SHORTEST_PATH_BACKENDS, default='heap',
+                        help="The implementation of the shortest path computations, "
+                             "a binary heap in Python or the compiled Dijkstra of "
+                             "SciPy. Default: '%(default)s'.")
     parser.add_argument('-a', '--all', dest='instances', action='store_const',
                         const='all', default='small',
                         help="Solve all 100 instances instead of 25 small instances "
@@ -226,6 +411,17 @@ def parse_args():
     parser.add_argument('-v', '--verbose', action='store_true',
                         help="Turn on verbosity mode. Can be set if and only if "
                              "a single instance id is provided with --id.")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="The number of processes evaluating the neighborhoods of "
+                             "a single instance, provided with --id. Default: %(default)s.")
+    parser.add_argument('-p', '--portfolio', type=int, default=1,
+                        help="The number of processes solving a single instance, provided "
+                             "with --id, from different starting solutions and with different "
+                             "neighborhoods. Default: %(default)s.")
+    parser.add_argument('--max-tasks-per-child', type=int, default=4,
+                        help="The number of instances solved by a process of the pool "
+                             "before it is replaced by a new one, to release its memory. "
+                             "Default: %(default)s.")
 
     args = parser.parse_args()
     args = check_args(parser, args)
@@ -275,17 +471,41 @@ def main():
     else:
         instances = args.id
 
-    # Create the pool of processes
-    pool = mp.Pool()
+    # The pool takes the instances in the order they are submitted, we start
+    # with the longest ones so that they do not delay the end of the run
+    costs = estimate_costs(instances, results)
+    instances = sorted(instances, key=costs.get, reverse=True)
 
-    for instance_id in instances:
-        pool.apply_async(solve, args=(instance_id, args), callback=collect_result)
+    busy_times = {}  # pid -> the number of instances solved and the time spent
+
+    def collect_task(task_result):
+        pid, busy_time, result = task_result
+
+        n_tasks, total_time = busy_times.get(pid, (0, 0))
+        busy_times[pid] = (n_tasks + 1, total_time + busy_time)
+
+        collect_result(result)
+
+    if args.jobs > 1 or args.portfolio > 1:
+        # The single instance is solved in this process, which
+        # starts its own pool of workers
+        collect_task(run_task(instances[0], args))
+        n_processes = 1
+    else:
+        n_processes = mp.cpu_count()
+        pool = mp.Pool(n_processes, maxtasksperchild=args.max_tasks_per_child)
+
+        for instance_id in instances:
+            pool.apply_async(run_task, args=(instance_id, args), callback=collect_task)
+
+        # Starting solving
+        pool.close()
+        pool.join()
 
-    # Starting solving
-    pool.close()
-    pool.join()
+    elapsed_time = time.time() - start
+    report_utilisation(busy_times, n_processes, elapsed_time)
 
-    print('Elapsed time:', time.time() - start)
+    print('Elapsed time:', elapsed_time)
 
 
 if __name__ == '__main__':
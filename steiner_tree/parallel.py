@@ -0,0 +1,77 @@
+import multiprocessing as mp
+
+from .utils import Deadline
+
+# The graph G shared with the workers, which are forked after it is set,
+# thus they read it from their copy of the parent memory
+_g = None
+_pool = None
+_processes = 0
+
+
+def start(g, processes):
+    """
+    Start the pool of workers evaluating the neighborhoods of S in G.
+    """
+    global _g, _pool, _processes
+
+    stop()
+
+    _g = g
+    _processes = processes
+    _pool = mp.get_context('fork').Pool(processes)
+
+
+def stop():
+    """
+    Stop the pool of workers, the neighborhoods are then evaluated in the current process.
+    """
+    global _g, _pool
+
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+
+    _g = None
+    _pool = None
+
+
+def _evaluate_chunk(evaluate, tree, s_weight, terminals, candidates, early_stop, deadline):
+    return evaluate(_g, tree, s_weight, terminals, candidates, early_stop, deadline)
+
+
+def best_move(evaluate, g, tree, s_weight, terminals, candidates, early_stop=True,
+              deadline=Deadline()):
+    """
+    Find the best move of a neighborhood of S, given by its tree and its weight.
+    The moves are evaluated by
+    evaluate(g, tree, s_weight, terminals, candidates, early_stop, deadline),
+    which returns the decrease in the weight of S with the best move built from
+    the candidates, or None if there is no improving move, together with the
+    list of the candidates evaluated without improvement. The evaluation stops
+    at the deadline, with the best move found so far.
+
+    If the pool of workers is started, the candidates are partitioned among the
+    workers, each of them sending back its best move, and the best of them is
+    returned. Only S and the candidates are sent to the workers, not G, thus
+    the moves in another graph, such as a perturbed copy of G, are evaluated
+    in the current process.
+    """
+    if deadline.expired():
+        return None, []
+
+    candidates = list(candidates)
+
+    if _pool is None or g is not _g or len(candidates) < 2:
+        return evaluate(g, tree, s_weight, terminals, candidates, early_stop, deadline)
+
+    n_chunks = min(_processes, len(candidates))
+    tasks = [(evaluate, tree, s_weight, terminals, candidates[i::n_chunks], early_stop, deadline)
+             for i in range(n_chunks)]
+
+    results = _pool.starmap(_evaluate_chunk, tasks)
+
+    moves = [move for move, _ in results if move is not None]
+    clean = [candidate for _, chunk_clean in results for candidate in chunk_clean]
+
+    return max(moves, key=lambda move: move[0], default=None), clean
@@ -0,0 +1,154 @@
+import multiprocessing as mp
+import time
+
+import numpy as np
+
+from . import key_paths, steiner_vertices
+from .iterated_local_search import IteratedLocalSearch, perturbed_graph
+from .solution import Solution
+from .utils import Deadline, find_starting_solution
+from .vnd import VariableNeighborhoodDescent
+
+# The instance and the incumbent weight shared with the workers,
+# which are forked after they are set
+_g = None
+_terminals = None
+_incumbent = None
+
+
+class CombinedSearch:
+    """
+    The neighborhoods of the Steiner vertices together with
+    the neighborhoods of the key vertices and key paths.
+    """
+    @staticmethod
+    def neighborhood_descent():
+        neighborhoods = steiner_vertices.neighborhood_descent().neighborhoods
+        neighborhoods += [neighborhood for neighborhood
+                          in key_paths.neighborhood_descent().neighborhoods
+                          if neighborhood not in neighborhoods]
+
+        return VariableNeighborhoodDescent(neighborhoods)
+
+    @staticmethod
+    def local_search(g, s, terminals, early_stop=True, deadline=Deadline(), vnd=None):
+        if vnd is None:
+            vnd = CombinedSearch.neighborhood_descent()
+
+        return vnd.run(g, s, terminals, early_stop=early_stop, deadline=deadline)
+
+
+STARTS = ('dnh', 'mst')
+METHODS = (key_paths, steiner_vertices, CombinedSearch)
+
+
+def random_start(g, terminals, rng):
+    """
+    A randomised DNH: the DNH solution of G with perturbed weights.
+    """
+    h = perturbed_graph(g, rng)
+    tree = find_starting_solution(h, terminals, algo='dnh')
+
+    return Solution(g, g.edge_subgraph(tree.edges), terminals)
+
+
+def publish(weight):
+    """
+    Update the incumbent weight shared by the workers.
+    """
+    with _incumbent.get_lock():
+        if weight < _incumbent.value:
+            _incumbent.value = weight
+
+
+class WorkerSearch(IteratedLocalSearch):
+    """
+    The iterated local search of a worker, which publishes its improvements
+    to the incumbent, and restarts from a new randomised DNH when the current
+    solution is heavier than the incumbent by more than the slack.
+    """
+    def __init__(self, g, terminals, method, slack, **kwargs):
+        super().__init__(g, terminals, method, **kwargs)
+        self.slack = slack
+
+    def improved(self, s):
+        super().improved(s)
+        publish(s.weight)
+
+    def restart(self, current, stall, deadline):
+        # Give up the current solution if it falls behind the other workers
+        if current.weight > (1 + self.slack) * _incumbent.value:
+            return self.descend(random_start(self.g, self.terminals, self.rng), deadline)
+
+        return super().restart(current, stall, deadline)
+
+
+def run_worker(i, seed, slack, early_stop, deadline, max_stall):
+    """
+    Run the i-th configuration of the portfolio: its starting solution is
+    DNH or MST for the first two workers, and a randomised DNH for the others,
+    the neighborhoods are chosen in turn among the key vertices, the Steiner
+    vertices and both. The solution is improved by an iterated local search,
+    which also restarts when the solution falls behind the incumbent.
+
+    Return the weight and the edges of the best solution found,
+    with the time it was found.
+    """
+    g, terminals = _g, _terminals
+    ils = WorkerSearch(g, terminals, METHODS[i % len(METHODS)], slack,
+                       seed=[seed, i], early_stop=early_stop)
+
+    if i < len(STARTS):
+        s = Solution(g, find_starting_solution(g, terminals, algo=STARTS[i]), terminals)
+    else:
+        s = random_start(g, terminals, ils.rng)
+
+    s = ils.descend(s, deadline)
+    start_time = time.time()
+    publish(s.weight)
+
+    best = ils.run(s, deadline, max_stall)
+    best_time = ils.history[-1][0] if ils.history else start_time
+
+    return best.weight, list(best.edges), best_time
+
+
+class Portfolio:
+    """
+    Solve an instance with several configurations of the local search in
+    parallel, one per worker. The workers share the weight of the best
+    solution found so far, the incumbent, to abandon the solutions which
+    fall behind. The best solution of all the workers is returned.
+    """
+    def __init__(self, g, terminals, n_workers, seed=0, slack=0.02, early_stop=True):
+        self.g = g
+        self.terminals = terminals
+        self.n_workers = n_workers
+        self.seed = seed
+        self.slack = slack
+        self.early_stop = early_stop
+        self.best_time = None
+
+    def run(self, deadline=Deadline(), max_stall=None):
+        """
+        Run the workers until the deadline, or until each of them did max_stall
+        iterations in a row without improvement, if provided.
+        """
+        global _g, _terminals, _incumbent
+
+        ctx = mp.get_context('fork')
+        _g, _terminals = self.g, self.terminals
+        _incumbent = ctx.Value('q', np.iinfo(np.int64).max)
+
+        tasks = [(i, self.seed, self.slack, self.early_stop, deadline, max_stall)
+                 for i in range(self.n_workers)]
+
+        try:
+            with ctx.Pool(self.n_workers) as pool:
+                results = pool.starmap(run_worker, tasks)
+        finally:
+            _g = _terminals = _incumbent = None
+
+        _, edges, self.best_time = min(results, key=lambda result: result[0])
+
+        return Solution(self.g, self.g.edge_subgraph(edges), self.terminals)
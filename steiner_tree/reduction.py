@@ -0,0 +1,173 @@
+import heapq
+
+import networkx as nx
+import numpy as np
+from networkx.utils import pairwise
+
+from .utils import CSRGraph
+
+
+class Reduction:
+    """
+    Reduce G with classical reduction tests for the Steiner tree problem before
+    the local search, and expand the solutions found in the reduced graph back
+    to G. The tests are applied repeatedly until none of them changes G:
+
+    - a non-terminal of degree 1 can be deleted, together with its edge;
+    - a non-terminal of degree 2 can be contracted: its two edges are replaced
+      by a single edge whose weight is their sum, the contracted path being
+      recorded to expand the solutions later;
+    - an edge (u, v) longer than the distance between u and v can be deleted,
+      as it is never in an optimal solution. This is the simplest case of the
+      bottleneck Steiner distance test, since the bottleneck distance is at most
+      the shortest path distance. The distances are only searched locally,
+      with at most max_settled vertices settled per vertex.
+
+    The nodes of the reduced graph are labelled by their indices in G.
+    """
+    def __init__(self, g, terminals, max_settled=32):
+        self.g = g
+        self.max_settled = max_settled
+
+        # The working copy of G, as a dict of dicts of weights
+        self.adj = {u: dict(zip(*g.adjacency(u))) for u in g.nodes}
+
+        # The contracted edges: (u, v) with u < v -> the path from u to v in G
+        self.paths = {}
+
+        changed = True
+        while changed:
+            self._degree_tests(terminals)
+            changed = self._long_edge_test()
+
+        nodes = sorted(self.adj)
+        index = {u: i for i, u in enumerate(nodes)}
+        edges = [(index[u], index[v], w) for u in nodes
+                 for v, w in self.adj[u].items() if u < v]
+        us, vs, ws = zip(*edges) if edges else ((), (), ())
+
+        self.graph = CSRGraph(len(nodes), us, vs, ws, labels=np.array(nodes, dtype=np.int64))
+        self.terminals = {index[t] for t in terminals}
+
+        del self.adj
+
+    def _path(self, u, v):
+        """
+        The path in G represented by the edge (u, v) of the working graph.
+        """
+        if u < v:
+            return self.paths.get((u, v), [u, v])
+
+        return self.paths.get((v, u), [v, u])[::-1]
+
+    def _set_edge(self, u, v, weight, path):
+        self.adj[u][v] = self.adj[v][u] = weight
+
+        if u > v:
+            u, v, path = v, u, path[::-1]
+
+        if len(path) > 2:
+            self.paths[u, v] = path
+        else:
+            self.paths.pop((u, v), None)
+
+    def _remove_edge(self, u, v):
+        del self.adj[u][v]
+        del self.adj[v][u]
+        self.paths.pop((min(u, v), max(u, v)), None)
+
+    def _degree_tests(self, terminals):
+        """
+        Delete the non-terminals of degree 1, and contract the non-terminals
+        of degree 2, until there is none left.
+        """
+        adj = self.adj
+        queue = [v for v in adj if len(adj[v]) <= 2 and v not in terminals]
+
+        while queue:
+            v = queue.pop()
+            if v not in adj or v in terminals or len(adj[v]) > 2:
+                continue
+
+            neighbors = list(adj[v].items())
+
+            if len(neighbors) == 2:
+                (u, w_u), (w, w_w) = neighbors
+                path = self._path(u, v) + self._path(v, w)[1:]
+                weight = w_u + w_w
+
+                self._remove_edge(u, v)
+                self._remove_edge(v, w)
+
+                # Keep the cheaper of the contracted path and the edge (u, w),
+                # if there was such an edge, u and w each lose one edge
+                parallel_edge = w in adj[u]
+                if not parallel_edge or weight < adj[u][w]:
+                    self._set_edge(u, w, weight, path)
+
+                if parallel_edge:
+                    queue.extend((u, w))
+            else:
+                for u, _ in neighbors:
+                    self._remove_edge(u, v)
+                    queue.append(u)
+
+            del adj[v]
+
+    def _long_edge_test(self):
+        """
+        Delete the edges longer than the distance between their endpoints.
+        Return whether any edge was deleted.
+        """
+        adj = self.adj
+        changed = False
+
+        for u in list(adj):
+            if not adj[u]:
+                continue
+
+            cutoff = max(adj[u].values())
+            dists = self._local_dijkstra(u, cutoff)
+
+            for v, w in list(adj[u].items()):
+                if dists.get(v, w) < w:
+                    self._remove_edge(u, v)
+                    changed = True
+
+        return changed
+
+    def _local_dijkstra(self, source, cutoff):
+        """
+        The distances from source to the vertices settled by a Dijkstra
+        limited to the distance cutoff and to max_settled settled vertices.
+        """
+        dists = {}
+        heap = [(0, source)]
+
+        while heap and len(dists) < self.max_settled:
+            dist, u = heapq.heappop(heap)
+            if u in dists:
+                continue
+
+            dists[u] = dist
+
+            for v, w in self.adj[u].items():
+                if v not in dists and dist + w < cutoff:
+                    heapq.heappush(heap, (dist + w, v))
+
+        return dists
+
+    def expand(self, s):
+        """
+        Expand a tree in the reduced graph to the corresponding tree in G.
+        """
+        labels = self.graph.labels.tolist()
+
+        tree = nx.Graph()
+        tree.add_nodes_from(labels[u] for u in s.nodes)
+
+        for a, b in s.edges:
+            path = self._path(labels[a], labels[b])
+            tree.add_weighted_edges_from((u, v, self.g.weight(u, v)) for u, v in pairwise(path))
+
+        return tree
@@ -1,9 +1,11 @@
+import argparse
 import io
+import multiprocessing as mp
 import os
+import pickle
 import sys
 import zipfile
 
-import networkx as nx
 import requests
 
 
@@ -44,40 +46,136 @@ def get_instances():
     print('Complete extracting\n')
 
 
-def compute_starting_solutions():
+ALGORITHMS = ('dnh', 'mst', 'mehlhorn')
+
+
+def solution_path(algo, instance_id):
+    return 'results/starting_solutions/{}/{}.npy'.format(algo, instance_id)
+
+
+def outdated_algorithms(instance_id):
     """
-    Precompute the starting solutions
+    The algorithms whose starting solution of the instance is missing,
+    or older than the instance file.
     """
-    from .utils import parse_graph, find_starting_solution
+    from .utils import instance_path
+
+    instance_mtime = os.path.getmtime(instance_path(instance_id))
 
-    for algo in ('dnh', 'mst'):
-        print('Computing the starting solutions using {}'.format(algo.upper()))
+    return [algo for algo in ALGORITHMS
+            if not os.path.exists(solution_path(algo, instance_id))
+            or os.path.getmtime(solution_path(algo, instance_id)) < instance_mtime]
+
+
+def compute_instance_solutions(task):
+    """
+    Compute the starting solutions of an instance using the given algorithms.
+    The instance is parsed once for all of them.
+    """
+    from .utils import parse_graph, find_starting_solution, write_solution
 
+    instance_id, algorithms = task
+    g, terminals = parse_graph(instance_id)
+
+    for algo in algorithms:
+        s = find_starting_solution(g, terminals, algo=algo)
+        write_solution(g, s, solution_path(algo, instance_id))
+
+    return instance_id, algorithms
+
+
+def compute_starting_solutions(instances=range(1, 200, 2), jobs=None):
+    """
+    Precompute the starting solutions in a pool of processes. Only the missing
+    and outdated solutions are computed, starting from the largest instances,
+    so that they do not delay the end of the computation.
+    """
+    from .utils import instance_path
+
+    for algo in ALGORITHMS:
         directory = 'results/starting_solutions/{}'.format(algo)
         if not os.path.exists(directory):
             os.makedirs(directory)
 
-        for i in range(1, 200, 2):
-            g, terminals = parse_graph(i)
-            s = find_starting_solution(g, terminals, algo=algo)
+    tasks = [(i, outdated_algorithms(i)) for i in instances]
+    tasks = [task for task in tasks if task[1]]
+    tasks.sort(key=lambda task: os.path.getsize(instance_path(task[0])), reverse=True)
 
-            nx.write_gpickle(s, '{}/{}.gpickle'.format(directory, i))
+    total = sum(len(algorithms) for _, algorithms in tasks)
+    if not total:
+        print('The starting solutions are up to date')
+        return
 
-            percentage = (i + 1) // 2
-            done = int(percentage / 2)
-            sys.stdout.write("\r[{}{}] {}/100".format(
-                '=' * done, ' ' * (50 - done), percentage)
+    print('Computing {} starting solutions of {} instances'.format(total, len(tasks)))
+
+    done = 0
+    with mp.Pool(jobs) as pool:
+        for _, algorithms in pool.imap_unordered(compute_instance_solutions, tasks):
+            done += len(algorithms)
+            percentage = 100 * done / total
+            bar = int(percentage / 2)
+
+            sys.stdout.write("\r[{}{}] {}/{}".format(
+                '=' * bar, ' ' * (50 - bar), done, total)
             )
             sys.stdout.flush()
 
-        print()
+    print()
+
+
+def migrate_solutions(directory='results'):
+    """
+    Convert the solutions saved as pickled networkx graphs by the previous
+    versions into the .npy edge lists, and remove the pickles.
+    """
+    from .utils import save_edges
+
+    count = 0
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if not file.endswith('.gpickle'):
+                continue
+
+            path = os.path.join(root, file)
+            with open(path, 'rb') as f:
+                s = pickle.load(f)
 
+            save_edges(path[:-len('.gpickle')] + '.npy', s.edges)
+            os.remove(path)
+            count += 1
 
-def setup():
-    get_instances()
-    compute_starting_solutions()
+    print('Migrated {} solutions'.format(count))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Download the public instances and '
+                                                 'precompute the starting solutions.')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help="The number of processes computing the starting solutions. "
+                             "Default: the number of CPUs.")
+    parser.add_argument('-i', '--id', nargs='+', type=int, default=range(1, 200, 2),
+                        help="Only compute the starting solutions of the instances with "
+                             "the id provided as a list of space-separated integers.")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Only convert the solutions saved as pickles by the previous "
+                             "versions into the current format.")
+
+    return parser.parse_args()
+
+
+def setup(instances=range(1, 200, 2), jobs=None):
+    # The instances are only downloaded once
+    if not os.path.exists('public'):
+        get_instances()
+
+    compute_starting_solutions(instances, jobs)
 
 
 if __name__ == '__main__':
-    setup()
-    print('Setup complete.')
+    args = parse_args()
+
+    if args.migrate:
+        migrate_solutions()
+    else:
+        setup(args.id, args.jobs)
+        print('Setup complete.')
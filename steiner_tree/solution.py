@@ -0,0 +1,216 @@
+from itertools import chain
+
+from networkx.utils import pairwise
+
+from . import parallel
+from .key_paths import KeyPathIndex
+from .utils import Deadline, graph_weight
+
+
+class Solution:
+    """
+    A Steiner tree S of G, shared by the neighborhoods, which modify it in place.
+    Together with the tree, we keep its total weight, its key vertices, which
+    are the non-terminals of degree at least 3, and its key paths, all updated
+    incrementally as the edges of S change.
+
+    The key paths are only maintained incrementally through replace_path,
+    other modifications drop them, and they are found again on demand.
+
+    The version of S is incremented by every modification, the neighborhoods
+    record in scanned the version of S they last scanned without improvement.
+
+    The neighborhoods find their moves through best_move, which keeps "don't
+    look" flags on their candidates: the candidates evaluated without
+    improvement are skipped by the next scans, until a modification of S
+    touches a vertex in their neighborhood in G, since most of them would
+    not improve S again. The gain of a candidate can also change after a
+    modification further away, thus a scan with flags is not a full scan
+    of the neighborhood.
+    """
+    def __init__(self, g, tree, terminals):
+        self.g = g
+        self.tree = tree
+        self.terminals = terminals
+        self.weight = graph_weight(tree)
+        self.key_vertices = {node for node in tree.nodes
+                             if tree.degree(node) >= 3 and node not in terminals}
+        self._key_paths = None
+        self.version = 0
+        self.scanned = {}  # name of a neighborhood -> version of S
+        self._dont_look = {}  # name of a neighborhood -> the vertices to skip
+        self._dont_look_paths = {}  # name of a neighborhood -> the paths to skip, as tuples
+
+    def __contains__(self, v):
+        return v in self.tree
+
+    def __len__(self):
+        return len(self.tree)
+
+    @property
+    def nodes(self):
+        return self.tree.nodes
+
+    @property
+    def edges(self):
+        return self.tree.edges
+
+    def degree(self, v):
+        return self.tree.degree(v)
+
+    @property
+    def key_paths(self):
+        if self._key_paths is None:
+            self._key_paths = KeyPathIndex(self.tree, self.terminals)
+
+        return self._key_paths
+
+    def best_move(self, neighborhood, evaluate, candidates, early_stop=True, deadline=Deadline(),
+                  paths=False):
+        """
+        Find the best move of the neighborhood with parallel.best_move, among
+        the candidates without don't look flags, then flag the candidates
+        evaluated without improvement. The candidates are vertices, or paths
+        if paths is set, which are flagged as tuples. Return None if there
+        is no improving move.
+        """
+        if paths:
+            dont_look = self._dont_look_paths.setdefault(neighborhood, set())
+            candidates = [path for path in candidates if tuple(path) not in dont_look]
+        else:
+            dont_look = self._dont_look.setdefault(neighborhood, set())
+            candidates = [v for v in candidates if v not in dont_look]
+
+        if not candidates:
+            return None
+
+        best_move, clean = parallel.best_move(evaluate, self.g, self.tree, self.weight,
+                                              self.terminals, candidates, early_stop, deadline)
+        dont_look.update(clean)
+
+        return best_move
+
+    def flagged(self, neighborhood):
+        """
+        Whether the neighborhood skips some of its candidates.
+        """
+        return bool(self._dont_look.get(neighborhood) or self._dont_look_paths.get(neighborhood))
+
+    def clear_flags(self, neighborhood):
+        """
+        Clear all the don't look flags of the neighborhood.
+        """
+        self._dont_look.pop(neighborhood, None)
+        self._dont_look_paths.pop(neighborhood, None)
+
+    def _touch(self, vertices):
+        """
+        Clear the don't look flags of the candidates around the modified vertices.
+        """
+        if not self._dont_look and not self._dont_look_paths:
+            return
+
+        dirty = set(vertices)
+        for v in vertices:
+            dirty.update(self.g.neighbors(v).tolist())
+
+        for candidates in self._dont_look.values():
+            candidates.difference_update(dirty)
+
+        for paths in self._dont_look_paths.values():
+            paths.difference_update([path for path in paths if not dirty.isdisjoint(path)])
+
+    def _update_status(self, v):
+        if v in self.tree and self.tree.degree(v) >= 3 and v not in self.terminals:
+            self.key_vertices.add(v)
+        else:
+            self.key_vertices.discard(v)
+
+    def add_edge(self, u, v, weight=None):
+        if weight is None:
+            weight = self.g.weight(u, v)
+
+        self.tree.add_edge(u, v, weight=weight)
+        self.weight += weight
+
+        self._update_status(u)
+        self._update_status(v)
+        self._key_paths = None
+        self.version += 1
+        self._touch((u, v))
+
+    def remove_edge(self, u, v):
+        self.weight -= self.tree.edges[u, v]['weight']
+        self.tree.remove_edge(u, v)
+
+        self._update_status(u)
+        self._update_status(v)
+        self._key_paths = None
+        self.version += 1
+        self._touch((u, v))
+
+    def remove_node(self, v):
+        for w in list(self.tree[v]):
+            self.remove_edge(v, w)
+
+        self.tree.remove_node(v)
+        self.version += 1
+
+    def replace_path(self, old_path, new_path):
+        """
+        Replace a key path of S by a path in G connecting the same two components.
+        """
+        tree = self.tree
+
+        # Remove path edges
+        self.weight -= sum(tree.edges[e]['weight'] for e in pairwise(old_path))
+        tree.remove_edges_from(pairwise(old_path))
+
+        # Remove internal vertices
+        tree.remove_nodes_from(old_path[1:-1])
+
+        # Add the edges from new_path
+        new_edges = [(u, v, self.g.weight(u, v)) for u, v in pairwise(new_path)]
+        tree.add_weighted_edges_from(new_edges)
+        self.weight += sum(w for _, _, w in new_edges)
+
+        # Only the ends of the two paths change their degrees
+        for v in (old_path[0], old_path[-1], new_path[0], new_path[-1]):
+            self._update_status(v)
+
+        if self._key_paths is not None:
+            self._key_paths.replace(tree, old_path, new_path)
+
+        self.version += 1
+        self._touch(set(old_path) | set(new_path))
+
+    def replace_tree(self, tree, weight):
+        """
+        Replace S by another tree of the given weight. The don't look flags
+        are kept, except around the vertices whose edges differ in the two trees.
+        """
+        old_edges = {frozenset(e) for e in self.tree.edges}
+        new_edges = {frozenset(e) for e in tree.edges}
+        touched = set(chain.from_iterable(old_edges ^ new_edges))
+        touched.update(set(self.tree.nodes) ^ set(tree.nodes))
+
+        self.tree = tree
+        self.weight = weight
+        self.key_vertices = {node for node in tree.nodes
+                             if tree.degree(node) >= 3 and node not in self.terminals}
+        self._key_paths = None
+        self.version += 1
+        self._touch(touched)
+
+    def prune(self):
+        """
+        Repeatedly remove the non-terminal leaves.
+        """
+        leaves = [node for node in self.tree.nodes
+                  if self.tree.degree(node) == 1 and node not in self.terminals]
+
+        for leaf in leaves:
+            while leaf in self.tree and self.tree.degree(leaf) == 1 and leaf not in self.terminals:
+                w = next(iter(self.tree[leaf]))
+                self.remove_node(leaf)
+                leaf = w
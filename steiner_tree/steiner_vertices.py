@@ -1,115 +1,312 @@
+from bisect import bisect_right
+
 import networkx as nx
-from networkx.utils import pairwise
+from networkx.utils import UnionFind
 
-from .utils import prune_tree, graph_weight
+from .link_cut_tree import LinkCutTree
+from .utils import Deadline, graph_weight
+from .vnd import VariableNeighborhoodDescent
 
 
-def try_insert_edge(s, e, w_e):
+def insertion_delta(tree, connecting_edges):
     """
-    Try to insert edge e = (u, v) with weight w_e into S.
-    We replace the longest edge connecting u and v in S
-    by e if its weight is greater than w_e.
+    Evaluate the insertion of the vertex v into S, given the edges connecting
+    v and S with their weights, without modifying S. The edges are added one at
+    a time into the link-cut tree of S, each replacing the longest edge on the
+    cycle it closes if it is lighter. The link-cut tree is restored afterward.
+
+    Return the change in the weight of S, with the edges to add to S
+    (with their weights) and the edges to remove from S.
     """
-    # The path connecting v and w in S
-    path = nx.dijkstra_path(s, *e)
+    delta = 0
+    added = {}
+    removed = []
 
-    # The edges on the path
-    path_edges = pairwise(path)
+    for i, (ei, wi) in enumerate(connecting_edges):
+        # We add the edges e1, e2,... in E(S, v) one at a time, after i-th step,
+        # the tree is the MST of (V_S ∪ v, E_S ∪ {e1,...,ei}
 
-    # Find the longest edge in the path connecting v and w in S
-    longest_edge = max(path_edges, key=lambda x: s.edges[x]['weight'])
+        if i == 0:
+            # Simply add the first connecting edge without doing anything extra
+            tree.link(*ei, wi)
+            added[ei] = wi
+            delta += wi
+            continue
 
-    # Replace the longest edge if it leads to an improvement
-    if s.edges[longest_edge]['weight'] > w_e:
-        s.remove_edge(*longest_edge)
-        s.add_edge(*e, weight=w_e)
+        # Now v is a node in S, we need to check if adding ei improve the weight
+        longest_edge, longest_weight = tree.path_max(*ei)
 
-    return s
+        if longest_weight > wi:
+            tree.cut(*longest_edge)
+            tree.link(*ei, wi)
+            delta += wi - longest_weight
+
+            if longest_edge in added:
+                del added[longest_edge]
+            else:
+                removed.append(longest_edge)
+
+            added[ei] = wi
+
+    # Restore the link-cut tree of S for the next evaluation
+    tree.rollback()
+
+    return delta, added, removed
+
+
+def best_insertion(g, tree, s_weight, terminals, candidates, early_stop=True,
+                   deadline=Deadline()):
+    """
+    Find the best insertion of a vertex of candidates into S, given by its tree.
+    Return the decrease in the weight of S, with the edges to add to S (with
+    their weights) and the edges to remove from S, or None if no insertion
+    leads to an improvement, together with the vertices which do not improve S.
+    """
+    # The link-cut tree of S, to find the longest edges
+    # on the paths of S without searching the graph
+    lct = LinkCutTree(tree)
+
+    best_move = None
+    clean = []
+
+    for v in candidates:
+        if deadline.expired():
+            break
+
+        # Find the edges connecting v and S, with their weights
+        connecting_edges = (((v, w), weight) for w, weight in zip(*g.adjacency(v))
+                            if w in tree)
+
+        delta, added, removed = insertion_delta(lct, connecting_edges)
+
+        if delta >= 0:
+            clean.append(v)
+        elif best_move is None or -delta > best_move[0]:
+            best_move = (-delta, (added, removed))
 
+            if early_stop:
+                # Break the loop as soon as we have an improvement
+                # without looking for the best one
+                break
+
+    return best_move, clean
 
-def steiner_vertices_insertion(g, s, terminals, early_stop=True):
+
+def steiner_vertices_insertion(g, s, terminals, early_stop=True, deadline=Deadline()):
     """
     Determine if there is a vertex v not in V_S such that MST(G[V_S ∪ v])
     is cheaper than S. For each available node, we add the edges connecting
     v and S one-by-one, and see if adding the edges leads to an improvement.
+
+    The insertions are evaluated as weight changes against the unchanged S,
+    only the best insertion found is applied to S, which is a Solution.
     """
-    available_nodes = set(g.nodes) - set(s.nodes)  # nodes can be inserted to S
-    if not available_nodes:
+    # nodes can be inserted to S
+    available_nodes = set(g.nodes) - set(s.nodes)
+
+    best_move = s.best_move('steiner_vertices_insertion', best_insertion, available_nodes,
+                            early_stop, deadline)
+
+    if best_move is None:
         return s
 
-    original_s = s.copy()
-    s_weight = graph_weight(s)
+    # Apply the best insertion
+    _, (added, removed) = best_move
+    for u, v in removed:
+        s.remove_edge(u, v)
+    for (u, v), w in added.items():
+        s.add_edge(u, v, w)
 
-    for v in available_nodes:
-        # Find the edges connecting v and S
-        connecting_edges = ((v, w) for w in g[v] & original_s.nodes)
+    s.prune()
 
-        new_s = original_s.copy()
-        for i, ei in enumerate(connecting_edges):
-            # We add the edges e1, e2,... in E(S, v) one at a time, after i-th step,
-            # new_s is the MST of (V_S ∪ v, E_S ∪ {e1,...,ei}
+    return s
 
-            if i == 0:
-                # Simply add the first connecting edge without doing anything extra
-                new_s = g.edge_subgraph(list(new_s.edges) + [ei]).copy()
-            else:
-                # Now v is a node in S, we need to check if adding ei improve the weight
-                new_s = try_insert_edge(new_s, ei, g.edges[ei]['weight'])
 
-        new_s_weight = graph_weight(new_s)
+class EliminationEvaluator:
+    """
+    Evaluate MST(G[V_S - v]) for the vertices v of S from the MST T of G[V_S].
+    Removing v from T splits it into one component per tree edge incident to v,
+    while the other tree edges stay in MST(G[V_S - v]). Thus it is enough to
+    reconnect the components using Kruskal's algorithm over the edges of G[V_S]
+    not in T, sorted once by weight, with a union-find on the components.
 
-        if new_s_weight < s_weight:
-            s_weight = new_s_weight
-            s = new_s.copy()
+    The components are identified using an Euler tour of T: the component of
+    a vertex x is the subtree of the child of v whose interval contains x,
+    or the component of the parent of v otherwise.
+    """
+    def __init__(self, g, s):
+        induced = g.subgraph(s.nodes)
 
-            if early_stop:
-                # Break the loop as soon as we have an improvement
-                # without looking for the best one
+        self.mst = nx.minimum_spanning_tree(induced)
+        self.weight = graph_weight(self.mst)
+        self.non_tree_edges = sorted((w, u, v) for u, v, w in induced.edges.data('weight')
+                                     if not self.mst.has_edge(u, v))
+
+        # Root T and compute the Euler tour intervals [tin, tout) of the subtrees
+        root = next(iter(self.mst.nodes))
+        self.parent = {root: None}
+        self.children = {}
+        self.tin = {}
+        self.tout = {}
+
+        clock = 0
+        stack = [(root, False)]
+        while stack:
+            u, done = stack.pop()
+            if done:
+                self.tout[u] = clock
+                continue
+
+            self.tin[u] = clock
+            clock += 1
+            stack.append((u, True))
+
+            self.children[u] = [w for w in self.mst[u] if w != self.parent[u]]
+            for w in self.children[u]:
+                self.parent[w] = u
+                stack.append((w, False))
+
+        for u in self.children:
+            self.children[u].sort(key=self.tin.get)
+
+        self.children_tin = {u: [self.tin[c] for c in children]
+                             for u, children in self.children.items()}
+
+    def _component(self, v, x):
+        """
+        The component of x in T - v, given by a neighbor of v in T.
+        """
+        children = self.children[v]
+        i = bisect_right(self.children_tin[v], self.tin[x]) - 1
+
+        if i >= 0 and self.tin[x] < self.tout[children[i]]:
+            return children[i]
+
+        return self.parent[v]
+
+    def evaluate(self, v):
+        """
+        Return the weight of MST(G[V_S - v]) and the edges reconnecting the
+        components of T - v, or None if G[V_S - v] is not connected.
+        """
+        n_components = self.mst.degree(v)
+        weight = self.weight - sum(w for _, _, w in self.mst.edges(v, data='weight'))
+        reconnecting_edges = []
+
+        subtrees = UnionFind()
+
+        for w, x, y in self.non_tree_edges:
+            if len(reconnecting_edges) == n_components - 1:
                 break
 
-    return prune_tree(s, terminals)
+            if x == v or y == v:
+                continue
+
+            cx = subtrees[self._component(v, x)]
+            cy = subtrees[self._component(v, y)]
+
+            if cx != cy:
+                subtrees.union(cx, cy)
+                reconnecting_edges.append((x, y, w))
+                weight += w
+
+        if len(reconnecting_edges) < n_components - 1:
+            return None
+
+        return weight, reconnecting_edges
 
+    def tree(self, v, reconnecting_edges):
+        """
+        Construct MST(G[V_S - v]) from the reconnecting edges.
+        """
+        tree = self.mst.copy()
+        tree.remove_node(v)
+        tree.add_weighted_edges_from(reconnecting_edges)
 
-def steiner_vertices_elimination(g, s, terminals, early_stop=True):
+        return tree
+
+
+def best_elimination(g, tree, s_weight, terminals, candidates, early_stop=True,
+                     deadline=Deadline()):
     """
-    Determine if there is a vertex v in V_S \ T such that MST(G[V_S - v])
-    is cheaper than S. We evaluate each possible removal by rerunning
-    Kruskal's algorithm on the induced subgraph.
+    Find the best removal of a vertex of candidates from S, given by its tree
+    and its weight. Return the decrease in the weight of S with the edges of
+    MST(G[V_S - v]), or None if no removal leads to an improvement, together
+    with the vertices which do not improve S.
     """
-    available_nodes = set(s.nodes) - terminals  # nodes can be deleted from s
-    if not available_nodes:
-        return s
+    evaluator = EliminationEvaluator(g, tree)
+    best_weight = s_weight
+    best_move = None
+    clean = []
 
-    original_s = s.copy()
-    s_weight = graph_weight(s)
+    for v in candidates:
+        if deadline.expired():
+            break
 
-    for v in available_nodes:
-        # Temporarily remove v from S
-        temp = g.subgraph(original_s.nodes).copy()
-        temp.remove_node(v)
+        result = evaluator.evaluate(v)
 
-        if not nx.is_connected(temp):
+        # Skip v if G[V_S - v] is not connected
+        if result is None or result[0] >= s_weight:
+            clean.append(v)
             continue
 
-        new_s = nx.minimum_spanning_tree(temp)
-        new_s_weight = graph_weight(new_s)
+        new_s_weight, reconnecting_edges = result
+
+        if new_s_weight < best_weight:
+            best_weight = new_s_weight
+            best_move = (v, reconnecting_edges)
 
-        if new_s_weight < s_weight:
             if early_stop:
-                # Return as soon as we have an improvement
+                # Stop as soon as we have an improvement
                 # without looking for the best one
-                return prune_tree(new_s, terminals)
+                break
 
-            s_weight = new_s_weight
-            s = new_s.copy()
+    if best_move is None:
+        return None, clean
 
-    s = prune_tree(s, terminals)
+    new_s = evaluator.tree(*best_move)
 
-    return s
+    return (s_weight - best_weight, list(new_s.edges.data('weight'))), clean
+
+
+def steiner_vertices_elimination(g, s, terminals, early_stop=True, deadline=Deadline()):
+    """
+    Determine if there is a vertex v in V_S \ T such that MST(G[V_S - v])
+    is cheaper than S. We evaluate each possible removal by reconnecting
+    the components of MST(G[V_S]) - v, and apply only the best removal
+    to S, which is a Solution.
+    """
+    # nodes can be deleted from s
+    available_nodes = set(s.nodes) - terminals
+
+    best_move = s.best_move('steiner_vertices_elimination', best_elimination, available_nodes,
+                            early_stop, deadline)
 
+    if best_move is not None:
+        new_s = nx.Graph()
+        new_s.add_weighted_edges_from(best_move[1])
+        s.replace_tree(new_s, s.weight - best_move[0])
 
-def local_search(g, s, terminals, early_stop=True):
-    s = steiner_vertices_elimination(g, s, terminals, early_stop=early_stop)
-    s = steiner_vertices_insertion(g, s, terminals, early_stop=early_stop)
+    s.prune()
 
     return s
+
+
+def neighborhood_descent():
+    """
+    A VND over the neighborhoods of the Steiner vertex elimination and insertion.
+    """
+    return VariableNeighborhoodDescent([steiner_vertices_elimination, steiner_vertices_insertion])
+
+
+def local_search(g, s, terminals, early_stop=True, deadline=Deadline(), vnd=None):
+    """
+    Apply the neighborhoods of the Steiner vertex elimination and insertion
+    until S is a local optimum for both, the most promising neighborhood first.
+    The VND given by neighborhood_descent() keeps the statistics of the
+    neighborhoods between the calls, a new one is used if it is not provided.
+    """
+    if vnd is None:
+        vnd = neighborhood_descent()
+
+    return vnd.run(g, s, terminals, early_stop=early_stop, deadline=deadline)
@@ -1,52 +1,661 @@
+import heapq
 import os
+import re
+import time
+from itertools import islice
 
 import networkx as nx
+import numpy as np
+from networkx.utils import UnionFind
 
 my_path = os.path.dirname(os.path.abspath(__file__))
 
+# Bump this to invalidate the binary caches of the parsed instances
+CACHE_VERSION = 1
 
-def parse_graph(instance_id):
-    file_path = 'public/instance{}.gr'.format(str(instance_id).zfill(3))
+# The available implementations of the shortest path computations
+SHORTEST_PATH_BACKENDS = ('heap', 'scipy')
+shortest_path_backend = 'heap'
+
+# A character which cannot appear in a block of edge lines, once the E are removed
+NOT_EDGE_LINE = re.compile(r'[^\d\s]')
+
+
+class CSRGraph:
+    """
+    A compact, read-only weighted undirected graph stored in the compressed
+    sparse row (CSR) format. The nodes are remapped to 0..n-1, the original
+    node ids are kept in labels, so that labels[u] is the id of the node u.
+
+    The neighbors of a node u are targets[offsets[u]:offsets[u + 1]], sorted
+    in increasing order, with the corresponding edge weights stored at the same
+    positions in weights. Each edge is also stored once in the edge arrays
+    edge_u, edge_v, edge_w, with edge_u < edge_v.
+
+    The graph G is only read during the local search, while the solution S is
+    small and modified all the time, thus S is still represented by a networkx
+    graph, whose nodes are the indices of the nodes in G.
+    """
+
+    def __init__(self, n_nodes, edge_u, edge_v, edge_w, labels=None):
+        edge_u = np.asarray(edge_u, dtype=np.int32)
+        edge_v = np.asarray(edge_v, dtype=np.int32)
+        edge_w = np.asarray(edge_w, dtype=np.int64)
+
+        # Store each edge once with edge_u < edge_v
+        swap = edge_u > edge_v
+        edge_u, edge_v = np.where(swap, edge_v, edge_u), np.where(swap, edge_u, edge_v)
+
+        self.edge_u = edge_u
+        self.edge_v = edge_v
+        self.edge_w = edge_w
+
+        if labels is None:
+            labels = np.arange(n_nodes)
+        self.labels = np.asarray(labels)
+        self._index = None
+        self._matrix = None
+
+        # Each edge appears in the adjacency of both of its endpoints
+        sources = np.concatenate((edge_u, edge_v))
+        targets = np.concatenate((edge_v, edge_u))
+        weights = np.concatenate((edge_w, edge_w))
+
+        order = np.lexsort((targets, sources))
+        self.targets = targets[order]
+        self.weights = weights[order]
+
+        self.offsets = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n_nodes), out=self.offsets[1:])
+
+    @classmethod
+    def from_edges(cls, us, vs, ws):
+        """
+        Construct the graph from the arrays of the endpoints and the weights
+        of the edges, where the endpoints are given by their original ids.
+        """
+        labels, inverse = np.unique(np.concatenate((us, vs)), return_inverse=True)
+        n_edges = len(us)
+
+        return cls(len(labels), inverse[:n_edges], inverse[n_edges:], ws, labels=labels)
+
+    @classmethod
+    def from_networkx(cls, g):
+        """
+        Convert a networkx graph with the edge attribute 'weight'.
+        """
+        us, vs, ws = zip(*g.edges.data('weight')) if g.number_of_edges() else ((), (), ())
+
+        return cls.from_edges(np.array(us, dtype=np.int64),
+                              np.array(vs, dtype=np.int64),
+                              np.array(ws, dtype=np.int64))
+
+    def to_networkx(self):
+        """
+        Convert to a networkx graph, with the original node ids.
+        """
+        return self.to_labels(self.edge_subgraph(zip(self.edge_u.tolist(),
+                                                     self.edge_v.tolist())))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __contains__(self, u):
+        return 0 <= u < len(self)
+
+    @property
+    def nodes(self):
+        return range(len(self))
+
+    def number_of_nodes(self):
+        return len(self)
+
+    def number_of_edges(self):
+        return len(self.edge_u)
+
+    def degree(self, u):
+        return int(self.offsets[u + 1] - self.offsets[u])
+
+    def neighbors(self, u):
+        return self.targets[self.offsets[u]:self.offsets[u + 1]]
+
+    def adjacency(self, u):
+        """
+        Return the neighbors of u together with the weights of
+        the corresponding edges, as two lists.
+        """
+        start, end = self.offsets[u], self.offsets[u + 1]
+
+        return self.targets[start:end].tolist(), self.weights[start:end].tolist()
+
+    def weight(self, u, v):
+        """
+        The weight of the edge (u, v). Raise KeyError if there is no such edge.
+        """
+        start, end = self.offsets[u], self.offsets[u + 1]
+        i = start + np.searchsorted(self.targets[start:end], v)
+
+        if i == end or self.targets[i] != v:
+            raise KeyError('The edge {} is not in the graph.'.format((u, v)))
+
+        return int(self.weights[i])
+
+    def to_scipy(self):
+        """
+        The adjacency matrix of the graph as a SciPy sparse matrix, built from
+        the CSR arrays of the graph. The matrix is built once and cached, with
+        float64 weights and int32 indices as scipy.sparse.csgraph expects,
+        so that csgraph uses it without copying it on every call.
+        """
+        if self._matrix is None:
+            from scipy.sparse import csr_matrix
+
+            n = len(self)
+            self._matrix = csr_matrix((self.weights.astype(np.float64),
+                                       self.targets.astype(np.int32),
+                                       self.offsets.astype(np.int32)), shape=(n, n))
+
+        return self._matrix
+
+    def edge_subgraph(self, edges):
+        """
+        The networkx graph formed by the given edges, with their weights.
+        """
+        h = nx.Graph()
+        h.add_weighted_edges_from((u, v, self.weight(u, v)) for u, v in edges)
+
+        return h
+
+    def subgraph(self, nodes):
+        """
+        The networkx graph induced by the given nodes.
+        """
+        nodes = set(nodes)
+        h = nx.Graph()
+        h.add_nodes_from(nodes)
+
+        for u in nodes:
+            for v, w in zip(*self.adjacency(u)):
+                if v in nodes:
+                    h.add_edge(u, v, weight=w)
+
+        return h
+
+    def index(self, label):
+        """
+        The index of the node with the given original id.
+        """
+        if self._index is None:
+            self._index = {label: u for u, label in enumerate(self.labels.tolist())}
+
+        return self._index[label]
+
+    def indices(self, labels):
+        """
+        The indices of the nodes with the given original ids, as an array.
+        The labels of G are sorted, thus they are found by a binary search.
+        """
+        labels = np.asarray(labels)
+        indices = np.searchsorted(self.labels, labels)
+
+        found = indices < len(self.labels)
+        found[found] = self.labels[indices[found]] == labels[found]
+        if not found.all():
+            raise KeyError(labels[~found].tolist()[0])
+
+        return indices
+
+    def to_labels(self, s):
+        """
+        Relabel a graph whose nodes are indices of nodes in G
+        with the original node ids.
+        """
+        labels = self.labels.tolist()
+
+        return nx.relabel_nodes(s, {u: labels[u] for u in s.nodes})
+
+    def from_labels(self, s):
+        """
+        Relabel a graph whose nodes are original node ids
+        with the corresponding indices of the nodes in G.
+        """
+        return nx.relabel_nodes(s, {label: self.index(label) for label in s.nodes})
+
+    def save(self, file, **arrays):
+        """
+        Save the graph to a .npz file, together with the additional arrays.
+        """
+        np.savez(file, labels=self.labels, edge_u=self.edge_u, edge_v=self.edge_v,
+                 edge_w=self.edge_w, offsets=self.offsets, targets=self.targets,
+                 weights=self.weights, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load a graph saved by CSRGraph.save. Return the graph and a dict
+        of the additional arrays saved together with the graph.
+        """
+        g = cls.__new__(cls)
+        g._index = None
+        g._matrix = None
+
+        with np.load(file) as data:
+            arrays = {key: data[key] for key in data.files}
+
+        for key in ('labels', 'edge_u', 'edge_v', 'edge_w', 'offsets', 'targets', 'weights'):
+            setattr(g, key, arrays.pop(key))
+
+        return g, arrays
+
+
+class Deadline:
+    """
+    The time limit of the local search, checked by the neighborhoods between
+    the evaluations of their candidates: once it expires, they stop and apply
+    the best improvement found so far. A timeout of 0 means no limit.
+
+    The deadline is measured with the monotonic clock, which is shared by
+    the processes, thus it can be sent to the workers evaluating candidates.
+    """
+    def __init__(self, timeout=0):
+        self.end = time.monotonic() + timeout if timeout else float('inf')
+
+    def expired(self):
+        return time.monotonic() >= self.end
+
+
+def set_shortest_path_backend(backend):
+    """
+    Choose the implementation of dijkstra and bounded_dijkstra: 'heap' is
+    a binary heap in pure Python, 'scipy' uses scipy.sparse.csgraph.
+    """
+    global shortest_path_backend
+
+    if backend not in SHORTEST_PATH_BACKENDS:
+        raise ValueError('Unknown shortest path backend: {}'.format(backend))
+
+    shortest_path_backend = backend
+
+
+def dijkstra(g, sources):
+    """
+    Multi-source Dijkstra on a CSR graph. Return three arrays dists, preds
+    and origins: dists[v] is the distance from the nearest source to v,
+    preds[v] is the predecessor of v on the shortest path from the nearest
+    source, and origins[v] is that source. A source is its own predecessor,
+    and the unreachable nodes have the distance inf and no predecessor (-1).
+    """
+    if shortest_path_backend == 'scipy':
+        return scipy_dijkstra(g, sources)
+
+    return heap_dijkstra(g, sources)
+
+
+def bounded_dijkstra(g, seeds, region):
+    """
+    Multi-source Dijkstra restricted to the nodes in region. The search starts
+    from the tentative labels in seeds, given as tuples (dist, v, pred) meaning
+    that v in region is reached with the distance dist from the predecessor pred.
+
+    Return the list of tuples (v, dist, pred) for the nodes in region reached
+    by the search, in the order they are settled, thus the predecessor of each
+    node is either a seed predecessor or a node that appears before it.
+    """
+    if shortest_path_backend == 'scipy':
+        return scipy_bounded_dijkstra(g, seeds, region)
+
+    return heap_bounded_dijkstra(g, seeds, region)
+
+
+def heap_dijkstra(g, sources):
+    n = len(g)
+    dists = np.full(n, np.inf)
+    preds = np.full(n, -1, dtype=np.int64)
+    origins = np.full(n, -1, dtype=np.int64)
+
+    # The tentative distances, stored in a dict since the heap
+    # usually touches only a small part of the graph
+    seen = {}
+    heap = []
+
+    for source in sources:
+        seen[source] = 0
+        preds[source] = source
+        origins[source] = source
+        heap.append((0, source))
+
+    heapq.heapify(heap)
+    done = np.zeros(n, dtype=bool)
+
+    while heap:
+        dist, u = heapq.heappop(heap)
+        if done[u]:
+            continue
+
+        done[u] = True
+        dists[u] = dist
+        origin = origins[u]
+
+        for v, w in zip(*g.adjacency(u)):
+            vu_dist = dist + w
+            if vu_dist < seen.get(v, float('inf')):
+                seen[v] = vu_dist
+                preds[v] = u
+                origins[v] = origin
+                heapq.heappush(heap, (vu_dist, v))
+
+    return dists, preds, origins
+
+
+def heap_bounded_dijkstra(g, seeds, region):
+    tentative = {}
+    heap = []
+
+    for dist, v, pred in seeds:
+        if dist < tentative.get(v, float('inf')):
+            tentative[v] = dist
+            heap.append((dist, v, pred))
+
+    heapq.heapify(heap)
+    settled = set()
+    order = []
+
+    while heap:
+        dist, v, pred = heapq.heappop(heap)
+        if v in settled:
+            continue
+
+        settled.add(v)
+        order.append((v, dist, pred))
+
+        for w, weight in zip(*g.adjacency(v)):
+            wv_dist = dist + weight
+            if w in region and w not in settled and wv_dist < tentative.get(w, float('inf')):
+                tentative[w] = wv_dist
+                heapq.heappush(heap, (wv_dist, w, v))
+
+    return order
+
+
+def scipy_dijkstra(g, sources):
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+
+    sources = np.fromiter(sources, dtype=np.int64)
+
+    # With min_only, a single run from all the sources gives the nearest
+    # source of each node, together with the shortest path tree
+    dists, preds, origins = csgraph_dijkstra(g.to_scipy(), indices=sources, min_only=True,
+                                             return_predecessors=True)
+
+    # SciPy marks the sources and the unreachable nodes with a negative predecessor
+    preds = preds.astype(np.int64)
+    preds[preds < 0] = -1
+    preds[sources] = sources
+    origins = origins.astype(np.int64)
+    origins[origins < 0] = -1
+
+    return dists, preds, origins
+
+
+def scipy_bounded_dijkstra(g, seeds, region):
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+
+    if not seeds:
+        return []
+
+    nodes = np.array(sorted(region), dtype=np.int64)
+    k = len(nodes)
+
+    # The edges of G induced by region, gathered from the CSR arrays
+    starts = g.offsets[nodes]
+    degrees = g.offsets[nodes + 1] - starts
+    positions = np.repeat(starts - np.cumsum(degrees) + degrees, degrees) + np.arange(degrees.sum())
+
+    rows = np.repeat(np.arange(k), degrees)
+    cols = np.searchsorted(nodes, g.targets[positions])
+    inside = nodes[np.minimum(cols, k - 1)] == g.targets[positions]
+
+    # A virtual source k reaches each seeded node with its best seed distance
+    best_seeds = {}
+    for dist, v, pred in seeds:
+        if v not in best_seeds or dist < best_seeds[v][0]:
+            best_seeds[v] = (dist, pred)
+
+    seeded = np.array(sorted(best_seeds), dtype=np.int64)
+    seed_dists = np.array([best_seeds[v][0] for v in seeded.tolist()], dtype=np.float64)
+
+    rows = np.concatenate((rows[inside], np.full(len(seeded), k)))
+    cols = np.concatenate((cols[inside], np.searchsorted(nodes, seeded)))
+    data = np.concatenate((g.weights[positions][inside], seed_dists))
+
+    matrix = csr_matrix((data, (rows, cols)), shape=(k + 1, k + 1))
+    dists, preds = csgraph_dijkstra(matrix, indices=k, return_predecessors=True)
+
+    # Traverse the shortest path tree from the virtual source, so that
+    # the predecessor of each node is listed before it
+    children = {}
+    for i, p in enumerate(preds[:k].tolist()):
+        if p >= 0:
+            children.setdefault(p, []).append(i)
+
+    order = []
+    stack = [k]
+    nodes = nodes.tolist()
+    while stack:
+        p = stack.pop()
+        for i in children.get(p, ()):
+            v = nodes[i]
+            pred = best_seeds[v][1] if p == k else nodes[p]
+            order.append((v, float(dists[i]), pred))
+            stack.append(i)
+
+    return order
+
+
+def minimum_spanning_tree(g):
+    """
+    Kruskal's algorithm on a CSR graph, return the MST as a networkx graph.
+    """
+    mst = nx.Graph()
+    mst.add_nodes_from(g.nodes)
+    subtrees = UnionFind()
+
+    for i in np.argsort(g.edge_w, kind='stable').tolist():
+        u, v = int(g.edge_u[i]), int(g.edge_v[i])
+
+        if subtrees[u] != subtrees[v]:
+            subtrees.union(u, v)
+            mst.add_edge(u, v, weight=int(g.edge_w[i]))
+
+    return mst
+
+
+def read_gr(file_path):
+    """
+    Read a file in the STP format used by the PACE Challenge. The file is read
+    section by section, and the edges are parsed in bulk from the whole block
+    of edge lines. Return the arrays of endpoints and weights of the edges,
+    and the list of terminals, given by their original ids.
+    """
+    us = vs = ws = None
+    n_edges = None
+    terminals = []
 
     with open(file_path) as f:
-        f.readline()
-        _ = int(f.readline().split()[1])
-        n_edges = int(f.readline().split()[1])
+        section = None
+
+        for line in f:
+            tokens = line.split()
+            if not tokens:
+                continue
+
+            keyword = tokens[0].upper()
+
+            if keyword == 'SECTION':
+                section = tokens[1].upper()
+            elif keyword in ('END', 'EOF'):
+                section = None
+            elif section == 'GRAPH' and keyword == 'EDGES':
+                n_edges = int(tokens[1])
+            elif section == 'GRAPH' and keyword == 'E':
+                if n_edges is None:
+                    raise ValueError('{}: the edges come before the Edges header.'.format(
+                        file_path
+                    ))
+
+                # The edge lines form a contiguous block, we parse the current
+                # line together with the rest of the block, without blank lines
+                lines = [line]
+                while len(lines) < n_edges:
+                    chunk = list(islice(f, n_edges - len(lines)))
+                    if not chunk:
+                        break
+
+                    lines.extend(chunk_line for chunk_line in chunk if not chunk_line.isspace())
+
+                block = ''.join(lines).replace('E', ' ')
+                edges = None
+                if len(lines) == n_edges and not NOT_EDGE_LINE.search(block):
+                    edges = np.fromstring(block, dtype=np.int64, sep=' ')
+
+                if edges is None or len(edges) != 3 * n_edges:
+                    raise ValueError('{}: expected {} edge lines after the Edges header.'.format(
+                        file_path, n_edges
+                    ))
+
+                us, vs, ws = edges.reshape(-1, 3).T
+            elif section == 'TERMINALS' and keyword == 'T':
+                terminals.append(int(tokens[1]))
+
+    return us, vs, ws, terminals
+
+
+def instance_path(instance_id, extension='gr'):
+    """
+    The path of an instance file, or of its binary cache with the extension 'npz'.
+    """
+    return 'public/instance{}.{}'.format(str(instance_id).zfill(3), extension)
+
+
+def instance_size(instance_id):
+    """
+    The number of edges and the number of terminals of an instance, read from
+    its binary cache, or from the section headers of the instance file if there
+    is no cache yet, without parsing the edges. Return None if neither of them
+    can be read.
+    """
+    try:
+        with np.load(instance_path(instance_id, 'npz')) as data:
+            return len(data['edge_u']), len(data['terminals'])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    n_edges = n_terminals = 0
+
+    try:
+        with open(instance_path(instance_id)) as f:
+            for line in f:
+                tokens = line.split()
+                if not tokens:
+                    continue
+
+                keyword = tokens[0].upper()
+
+                if keyword == 'EDGES':
+                    n_edges = int(tokens[1])
+                elif keyword == 'E':
+                    # Skip the rest of the block of edge lines
+                    for _ in islice(f, n_edges - 1):
+                        pass
+                elif keyword == 'TERMINALS':
+                    n_terminals = int(tokens[1])
+                    break
+    except (OSError, ValueError, IndexError):
+        return None
+
+    if not n_edges or not n_terminals:
+        return None
+
+    return n_edges, n_terminals
+
+
+def parse_graph(instance_id, use_cache=True):
+    """
+    Parse an instance into a CSR graph G and the set of terminals,
+    where the terminals are given by their indices in G.
 
-        g = nx.Graph()
+    The parsed instance is cached in a binary file next to the instance
+    file, which is loaded instead of the instance file in the later runs.
+    """
+    file_path = instance_path(instance_id)
+    cache_path = instance_path(instance_id, 'npz')
+
+    if (use_cache and os.path.exists(cache_path)
+            and os.path.getmtime(cache_path) >= os.path.getmtime(file_path)):
+        g, arrays = CSRGraph.load(cache_path)
+
+        if arrays.get('version') == CACHE_VERSION:
+            return g, set(arrays['terminals'].tolist())
 
-        for _ in range(n_edges):
-            u, v, w = map(int, f.readline().split()[1:])
-            g.add_edge(u, v, weight=w)
+    us, vs, ws, terminals = read_gr(file_path)
 
-        # END .. SECTION Terminals lines
-        # instance199.gr does not follow the format: there is no
-        # blank line between END and SECTION Terminals
-        if instance_id == 199:
-            for _ in range(2):
-                f.readline()
-        else:
-            for _ in range(3):
-                f.readline()
+    g = CSRGraph.from_edges(us, vs, ws)
+    terminals = set(g.index(t) for t in terminals)
 
-        n_terminals = int(f.readline().split()[1])
-        terminals = set(int(f.readline().split()[1]) for _ in range(n_terminals))
+    if use_cache:
+        try:
+            g.save(cache_path, terminals=np.array(sorted(terminals), dtype=np.int64),
+                   version=CACHE_VERSION)
+        except OSError:
+            # The cache is only an optimization, we can still
+            # solve the instance without it
+            pass
 
     return g, terminals
 
 
+def save_edges(file, edges):
+    """
+    Save a list of edges given by the original node ids to a .npy file,
+    as an array of shape (m, 2) of 32-bit integers.
+    """
+    np.save(file, np.array(list(edges), dtype=np.int32).reshape(-1, 2))
+
+
+def write_solution(g, s, file):
+    """
+    Save a solution S whose nodes are indices of nodes in G. Only the edges of S
+    are stored, with the original node ids, the weights being given by G.
+    """
+    save_edges(file, g.labels[np.array(list(s.edges), dtype=np.int64).reshape(-1, 2)])
+
+
+def read_solution(g, file):
+    """
+    Read a solution saved by write_solution, as a networkx graph whose
+    nodes are indices of nodes in G. The file is memory-mapped.
+    """
+    edges = np.load(file, mmap_mode='r')
+
+    return g.edge_subgraph(g.indices(edges).tolist())
+
+
 def find_starting_solution(g, terminals, algo='dnh'):
     """
     Find a starting solution for the local search.
     Return S = (V_S, E_S) where S = MST(G[V_S]),
     and all degree-one vertices are terminals
     """
-    from .key_paths import distance_network_heuristics
+    from .key_paths import distance_network_heuristics, mehlhorn
 
     if algo == 'dnh':
         return distance_network_heuristics(g, terminals)
 
-    tree = nx.minimum_spanning_tree(g)
+    if algo == 'mehlhorn':
+        return mehlhorn(g, terminals)
+
+    tree = minimum_spanning_tree(g)
     tree = prune_tree(tree, terminals)
 
     return tree
@@ -83,7 +692,6 @@ def get_contest_results():
     """
     import requests
     import bs4
-    import numpy as np
 
     def to_int(s):
         try:
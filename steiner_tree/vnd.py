@@ -0,0 +1,89 @@
+import time
+
+from .utils import Deadline
+
+
+class VariableNeighborhoodDescent:
+    """
+    Apply the neighborhoods to S until none of them improves it. The most
+    promising neighborhood is applied first, according to the expected time
+    it takes to find an improvement: the mean time of its calls so far divided
+    by its hit rate. After each improvement the search starts again from the
+    most promising one. Thus the cheap neighborhoods reach their local optimum
+    before the expensive ones are called. The neighborhoods not called yet
+    come first, in the given order.
+
+    A neighborhood which scanned S entirely without improving it is skipped,
+    until S changes: the version of S at the last unsuccessful scan of each
+    neighborhood is recorded in S. A scan which skipped the candidates with
+    don't look flags is not a full scan, thus when it fails the flags of the
+    neighborhood are cleared, and the neighborhood scans S again in full
+    before it is skipped.
+
+    The number of calls, improvements and the time spent are tracked for
+    each neighborhood, over all the runs of the VND, thus the same VND is
+    used for all the local searches of an instance.
+    """
+    def __init__(self, neighborhoods):
+        self.neighborhoods = list(neighborhoods)
+        self.calls = dict.fromkeys(self.neighborhoods, 0)
+        self.hits = dict.fromkeys(self.neighborhoods, 0)
+        self.times = dict.fromkeys(self.neighborhoods, 0)
+
+    def cost(self, neighborhood):
+        """
+        The mean time of a call to the neighborhood.
+        """
+        calls = self.calls[neighborhood]
+        return self.times[neighborhood] / calls if calls else 0
+
+    def hit_rate(self, neighborhood):
+        """
+        The fraction of the calls to the neighborhood which improved S.
+        """
+        calls = self.calls[neighborhood]
+        return self.hits[neighborhood] / calls if calls else 0
+
+    def priority(self, neighborhood):
+        """
+        The expected time to find an improvement with the neighborhood. The hit
+        rate is smoothed, so that a neighborhood which has not improved S yet
+        is still called, but after the others.
+        """
+        calls = self.calls[neighborhood]
+        if not calls:
+            return 0
+
+        return self.cost(neighborhood) * (calls + 2) / (self.hits[neighborhood] + 1)
+
+    def run(self, g, s, terminals, early_stop=True, deadline=Deadline()):
+        while not deadline.expired():
+            pending = [neighborhood for neighborhood in self.neighborhoods
+                       if s.scanned.get(neighborhood.__name__) != s.version]
+            if not pending:
+                break
+
+            # min keeps the first of the neighborhoods with the same priority
+            neighborhood = min(pending, key=self.priority)
+
+            name = neighborhood.__name__
+            s_weight = s.weight
+            version = s.version
+            flagged = s.flagged(name)
+
+            start = time.time()
+            s = neighborhood(g, s, terminals, early_stop=early_stop, deadline=deadline)
+            self.times[neighborhood] += time.time() - start
+            self.calls[neighborhood] += 1
+
+            if s.weight < s_weight:
+                self.hits[neighborhood] += 1
+            elif s.version == version and not deadline.expired():
+                if flagged:
+                    # Some candidates were skipped, scan them all again
+                    s.clear_flags(name)
+                else:
+                    # The whole neighborhood was scanned without improvement
+                    s.scanned[name] = s.version
+
+        return s
@@ -0,0 +1,33 @@
+from .utils import random_graph
+
+
+def test_iterated_local_search():
+    from steiner_tree import key_paths, steiner_vertices
+    from steiner_tree.iterated_local_search import IteratedLocalSearch
+    from steiner_tree.solution import Solution
+    from steiner_tree.utils import (Deadline, check_solution, find_starting_solution,
+                                    graph_weight)
+
+    for seed, method in ((5, steiner_vertices), (4, key_paths)):
+        g = random_graph(200, 600, seed)
+        terminals = set(range(0, 200, 10))
+
+        runs = []
+        for _ in range(2):
+            s = Solution(g, find_starting_solution(g, terminals, algo='mst'), terminals)
+            ils = IteratedLocalSearch(g, terminals, method, seed=seed, restart_after=3)
+            s = ils.descend(s, Deadline())
+            runs.append((ils, ils.run(s, Deadline(), max_stall=6), s.weight))
+
+        (ils1, best1, start_weight), (ils2, best2, _) = runs
+
+        # The same seed gives the same run, up to the times of the improvements
+        assert ils1.n_iterations == ils2.n_iterations
+        assert [w for _, w in ils1.history] == [w for _, w in ils2.history]
+        assert best1.weight == best2.weight
+        assert ils1.history
+
+        # The best solution is a tree of G with its maintained weight
+        check_solution(best1.tree, terminals)
+        assert all(g.weight(u, v) == w for u, v, w in best1.edges.data('weight'))
+        assert best1.weight == graph_weight(best1.tree) <= start_weight
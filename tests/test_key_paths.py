@@ -1,4 +1,20 @@
-from .utils import small_instances
+import networkx as nx
+import numpy as np
+import pytest
+
+from .utils import random_graph, small_instances
+
+
+@pytest.fixture(params=['heap', 'scipy'])
+def backend(request):
+    """
+    Run the test with each shortest path backend, then restore the default one.
+    """
+    from steiner_tree.utils import set_shortest_path_backend, shortest_path_backend
+
+    set_shortest_path_backend(request.param)
+    yield request.param
+    set_shortest_path_backend(shortest_path_backend)
 
 
 def test_find_key_paths():
@@ -22,3 +38,135 @@ def test_find_key_paths():
 
         assert ends == crucial_vertices
         assert nodes == set(s.nodes)
+
+
+def test_mehlhorn(backend):
+    from steiner_tree.utils import graph_weight
+    from steiner_tree.key_paths import mehlhorn, distance_network_heuristics
+
+    for seed in range(5):
+        g = random_graph(300, 900, seed)
+        terminals = set(range(0, 300, 15))
+        s = mehlhorn(g, terminals)
+
+        assert terminals <= set(s.nodes)
+        assert nx.is_tree(s)
+        assert graph_weight(s) == graph_weight(distance_network_heuristics(g, terminals))
+
+
+def test_voronoi_repair(backend):
+    from steiner_tree.key_paths import (VoronoiDiagram, distance_network_heuristics,
+                                        find_key_paths)
+    from steiner_tree.utils import dijkstra
+
+    for seed in range(5):
+        g = random_graph(300, 900, seed)
+        terminals = set(range(0, 300, 15))
+        s = distance_network_heuristics(g, terminals)
+        crucial_vertices = {node for node in s.nodes
+                            if s.degree(node) >= 3 or node in terminals}
+
+        voronoi = VoronoiDiagram(g, s.nodes)
+        before = (voronoi.bases.copy(), voronoi.preds.copy(), voronoi.dists.copy(),
+                  {base: set(cell) for base, cell in voronoi.cells.items()})
+
+        for key_path in find_key_paths(s, crucial_vertices):
+            s1, s2 = voronoi.repair(g, s, key_path)
+
+            # The repaired distances are the distances from the nearest
+            # vertex of either component of S - key path
+            dists1, _, _ = dijkstra(g, list(s1.centers))
+            dists2, _, _ = dijkstra(g, list(s2.centers))
+            assert (voronoi.dists == np.minimum(dists1, dists2)).all()
+            assert set(s1) | set(s2) == set(g.nodes)
+            assert all(voronoi.dists[v] == dists1[v] for v in s1)
+            assert all(voronoi.dists[v] == dists2[v] for v in s2)
+
+            voronoi.rollback()
+
+            assert (voronoi.bases == before[0]).all()
+            assert (voronoi.preds == before[1]).all()
+            assert (voronoi.dists == before[2]).all()
+            assert voronoi.cells == before[3]
+
+
+def auxiliary_mst_weight(edges, removed=()):
+    """
+    The weight of the MST of the auxiliary graph given by its edges
+    (weight, base_u, base_v, u, v), without the removed centers.
+    """
+    h = nx.Graph()
+    for weight, base_u, base_v, _, _ in edges:
+        if base_u in removed or base_v in removed:
+            continue
+        if not h.has_edge(base_u, base_v) or weight < h.edges[base_u, base_v]['weight']:
+            h.add_edge(base_u, base_v, weight=weight)
+
+    return nx.minimum_spanning_tree(h).size(weight='weight')
+
+
+def test_distance_network_remove_center(backend):
+    from steiner_tree.key_paths import DistanceNetwork, VoronoiDiagram, auxiliary_edges
+
+    for seed in range(5):
+        g = random_graph(300, 900, seed)
+        centers = set(range(0, 300, 10))
+
+        network = DistanceNetwork(g, centers)
+        voronoi = network.voronoi
+        before = (voronoi.bases.copy(), voronoi.preds.copy(), voronoi.dists.copy(),
+                  {base: set(cell) for base, cell in voronoi.cells.items()})
+
+        for center in sorted(centers):
+            network.remove_center(center)
+
+            # The same auxiliary graph as the DNH of C \ {v} from scratch
+            expected = VoronoiDiagram(g, centers - {center})
+            assert (voronoi.dists == expected.dists).all()
+            assert (auxiliary_mst_weight(network.edges + network.new_edges, {center}) ==
+                    auxiliary_mst_weight(auxiliary_edges(g, expected)))
+
+            tree = network.steiner_tree()
+            assert nx.is_tree(tree)
+            assert centers - {center} <= set(tree.nodes)
+
+            network.rollback()
+
+            assert (voronoi.bases == before[0]).all()
+            assert (voronoi.preds == before[1]).all()
+            assert (voronoi.dists == before[2]).all()
+            assert voronoi.cells == before[3]
+
+
+def test_key_path_index_replace():
+    from steiner_tree.key_paths import (best_key_path_exchange, distance_network_heuristics,
+                                        find_key_paths)
+    from steiner_tree.solution import Solution
+
+    def normalized(paths):
+        return {min(tuple(path), tuple(path[::-1])) for path in paths}
+
+    n_replaced = 0
+
+    for seed in range(5):
+        g = random_graph(300, 900, seed)
+        terminals = set(range(0, 300, 15))
+        s = Solution(g, distance_network_heuristics(g, terminals), terminals)
+
+        while True:
+            best_move, _ = best_key_path_exchange(g, s.tree, s.weight, terminals, s.key_paths)
+            if best_move is None:
+                break
+
+            s.replace_path(*best_move[1])
+            n_replaced += 1
+
+            # The index matches the key paths found from scratch
+            crucial_vertices = {node for node in s.nodes
+                                if s.degree(node) >= 3 or node in terminals}
+            assert s.key_paths.crucial_vertices == crucial_vertices
+            key_paths = find_key_paths(s.tree, crucial_vertices)
+            assert len(s.key_paths) == len(key_paths)
+            assert normalized(s.key_paths) == normalized(key_paths)
+
+    assert n_replaced
@@ -0,0 +1,46 @@
+import random
+
+import networkx as nx
+
+
+def test_path_max():
+    from steiner_tree.link_cut_tree import LinkCutTree
+
+    rnd = random.Random(0)
+    t = nx.Graph()
+    for v in range(1, 50):
+        t.add_edge(rnd.randrange(v), v, weight=rnd.randint(1, 100))
+
+    tree = LinkCutTree(t)
+
+    for _ in range(200):
+        u, v = rnd.sample(list(t.nodes), 2)
+
+        path = nx.shortest_path(t, u, v)
+        expected = max(t.edges[e]['weight'] for e in zip(path, path[1:]))
+        (a, b), weight = tree.path_max(u, v)
+
+        assert weight == expected == t.edges[a, b]['weight']
+
+        # Swap the heaviest edge with the edge (u, v), as in the MST update
+        if not t.has_edge(u, v):
+            t.remove_edge(a, b)
+            t.add_edge(u, v, weight=rnd.randint(1, 100))
+            tree.cut(a, b)
+            tree.link(u, v, t.edges[u, v]['weight'])
+
+
+def test_rollback():
+    from steiner_tree.link_cut_tree import LinkCutTree
+
+    t = nx.Graph()
+    t.add_weighted_edges_from([(1, 2, 5), (2, 3, 1), (3, 4, 7)])
+
+    tree = LinkCutTree(t)
+    tree.cut(3, 4)
+    tree.link(1, 4, 2)
+    assert tree.path_max(3, 4)[1] == 5
+
+    tree.rollback()
+    assert tree.path_max(1, 4)[1] == 7
+    assert not tree.journal
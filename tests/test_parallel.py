@@ -0,0 +1,40 @@
+from .utils import random_graph
+
+
+def test_best_move():
+    from steiner_tree import parallel
+    from steiner_tree.key_paths import best_key_path_exchange, best_key_vertex_elimination
+    from steiner_tree.solution import Solution
+    from steiner_tree.steiner_vertices import best_elimination, best_insertion
+    from steiner_tree.utils import find_starting_solution
+
+    for seed in range(3):
+        g = random_graph(300, 900, seed)
+        terminals = set(range(0, 300, 12))
+        s = Solution(g, find_starting_solution(g, terminals, algo='mst'), terminals)
+
+        neighborhoods = [
+            (best_insertion, set(g.nodes) - set(s.nodes)),
+            (best_elimination, set(s.nodes) - terminals),
+            (best_key_vertex_elimination, s.key_vertices),
+            (best_key_path_exchange, list(s.key_paths)),
+        ]
+
+        for evaluate, candidates in neighborhoods:
+            moves = []
+
+            for processes in (None, 2):
+                if processes is not None:
+                    parallel.start(g, processes)
+
+                try:
+                    move, clean = parallel.best_move(evaluate, g, s.tree, s.weight, terminals,
+                                                     candidates, early_stop=False)
+                finally:
+                    parallel.stop()
+
+                moves.append((move[0] if move is not None else None, sorted(clean)))
+
+            # The best gain and the candidates without improvement do not
+            # depend on how the candidates are split among the workers
+            assert moves[0] == moves[1], evaluate.__name__
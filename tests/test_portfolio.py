@@ -0,0 +1,21 @@
+from .utils import random_graph
+
+
+def test_portfolio():
+    from steiner_tree.portfolio import Portfolio
+    from steiner_tree.utils import (Deadline, check_solution, find_starting_solution,
+                                    graph_weight)
+
+    g = random_graph(200, 600, 0)
+    terminals = set(range(0, 200, 10))
+
+    portfolio = Portfolio(g, terminals, 3)
+    s = portfolio.run(Deadline(), max_stall=2)
+
+    # The best solution of the workers is a tree of G, at least as good
+    # as the DNH solution the first worker starts from
+    check_solution(s.tree, terminals)
+    assert all(g.weight(u, v) == w for u, v, w in s.edges.data('weight'))
+    assert s.weight == graph_weight(s.tree)
+    assert s.weight <= graph_weight(find_starting_solution(g, terminals, algo='dnh'))
+    assert portfolio.best_time is not None
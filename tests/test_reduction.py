@@ -0,0 +1,47 @@
+import networkx as nx
+
+
+def test_reduction():
+    from steiner_tree.key_paths import distance_network_heuristics
+    from steiner_tree.reduction import Reduction
+    from steiner_tree.utils import CSRGraph, graph_weight
+
+    h = nx.Graph()
+    # A cycle of terminals 1, 4, 6 through the non-terminals 2, 3 and 5,
+    # with a non-terminal pendant vertex 7 and a long edge (1, 4)
+    h.add_weighted_edges_from([(1, 2, 1), (2, 3, 1), (3, 4, 1), (4, 5, 2),
+                               (5, 6, 2), (6, 1, 5), (1, 4, 10), (3, 7, 1)])
+    g = CSRGraph.from_networkx(h)
+    terminals = {g.index(1), g.index(4), g.index(6)}
+
+    reduction = Reduction(g, terminals)
+    reduced = reduction.graph
+
+    # Only the terminals are left, the paths 1-2-3-4 and 4-5-6 are contracted
+    assert sorted(g.labels[reduced.labels].tolist()) == [1, 4, 6]
+    assert reduced.number_of_edges() == 3
+    assert sorted(reduced.edge_w.tolist()) == [3, 4, 5]
+
+    s = distance_network_heuristics(reduced, reduction.terminals)
+    tree = g.to_labels(reduction.expand(s))
+
+    assert nx.is_tree(tree)
+    assert graph_weight(tree) == graph_weight(s) == 7
+    assert {tuple(sorted(e)) for e in tree.edges} == {(1, 2), (2, 3), (3, 4), (4, 5), (5, 6)}
+
+
+def test_reduction_parallel_edge():
+    from steiner_tree.reduction import Reduction
+    from steiner_tree.utils import CSRGraph
+
+    h = nx.Graph()
+    # The path 1-2-3-4-5 between the terminals 1 and 5, with a long edge (2, 4)
+    # replaced by the contracted path 2-3-4, after which 2 and 4 have degree 2
+    h.add_weighted_edges_from([(1, 2, 1), (2, 3, 1), (3, 4, 1), (4, 5, 1), (2, 4, 10)])
+    g = CSRGraph.from_networkx(h)
+    terminals = {g.index(1), g.index(5)}
+
+    reduced = Reduction(g, terminals).graph
+
+    assert sorted(g.labels[reduced.labels].tolist()) == [1, 5]
+    assert reduced.edge_w.tolist() == [4]
@@ -0,0 +1,59 @@
+import networkx as nx
+
+from .utils import random_graph
+
+
+def check_bookkeeping(s, terminals):
+    """
+    The maintained weight and key vertices of S match the ones computed from scratch.
+    """
+    from steiner_tree.utils import graph_weight
+
+    assert s.weight == graph_weight(s.tree)
+    assert s.key_vertices == {node for node in s.nodes
+                              if s.degree(node) >= 3 and node not in terminals}
+
+
+def test_solution():
+    from steiner_tree.key_paths import best_key_path_exchange, distance_network_heuristics
+    from steiner_tree.solution import Solution
+    from steiner_tree.utils import graph_weight
+
+    g = random_graph(300, 900, 0)
+    terminals = set(range(0, 300, 15))
+    s = Solution(g, distance_network_heuristics(g, terminals), terminals)
+    check_bookkeeping(s, terminals)
+
+    # Attach a path of two non-terminals outside of S to a vertex of degree 2,
+    # which becomes a key vertex
+    u = next(node for node in s.nodes if s.degree(node) == 2 and node not in terminals)
+    v = next(w for w in g.neighbors(u).tolist() if w not in s and w not in terminals)
+    x = next(w for w in g.neighbors(v).tolist() if w not in s and w not in terminals)
+
+    s.add_edge(u, v)
+    s.add_edge(v, x)
+    check_bookkeeping(s, terminals)
+    assert u in s.key_vertices
+
+    s.remove_edge(v, x)
+    check_bookkeeping(s, terminals)
+    s.remove_node(x)
+
+    # The pendant non-terminal v is pruned
+    s.prune()
+    check_bookkeeping(s, terminals)
+    assert v not in s and u not in s.key_vertices
+    assert all(node in terminals for node in s.nodes if s.degree(node) == 1)
+
+    best_move, _ = best_key_path_exchange(g, s.tree, s.weight, terminals, s.key_paths)
+    assert best_move is not None
+    s_weight = s.weight
+    s.replace_path(*best_move[1])
+    check_bookkeeping(s, terminals)
+    assert s.weight == s_weight - best_move[0]
+
+    mst = nx.minimum_spanning_tree(g.subgraph(s.nodes))
+    s.replace_tree(mst, graph_weight(mst))
+    s.prune()
+    check_bookkeeping(s, terminals)
+    assert nx.is_tree(s.tree) and terminals <= set(s.nodes)
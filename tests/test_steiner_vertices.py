@@ -1,17 +1,33 @@
 import networkx as nx
 
-from .utils import get_path
+from .utils import random_graph
 
 
-def test_try_insert_edge():
-    from steiner_tree.steiner_vertices import try_insert_edge
+def test_insertion_delta():
+    from steiner_tree.link_cut_tree import LinkCutTree
+    from steiner_tree.steiner_vertices import insertion_delta
+    from steiner_tree.utils import graph_weight
 
-    inp = nx.read_gpickle(get_path('testcases/insert_edge_inp_1.gpickle'))
-    out = nx.read_gpickle(get_path('testcases/insert_edge_out_1.gpickle'))
+    inp = nx.Graph()
+    inp.add_nodes_from(range(1, 7))
+    inp.add_weighted_edges_from([(1, 2, 2), (2, 6, 3), (3, 4, 4), (3, 6, 5), (5, 6, 2)])
+    tree = LinkCutTree(inp)
 
-    g = try_insert_edge(inp, (4, 5), 3)
+    # Insert the vertex 7 connected to 4 and 5, the edge (3, 6) is replaced
+    connecting_edges = [((7, 4), 1), ((7, 5), 2)]
+    delta, added, removed = insertion_delta(tree, connecting_edges)
 
-    assert g._adj == out._adj
+    assert added == {(7, 4): 1, (7, 5): 2}
+    assert removed == [(3, 6)]
+
+    expected = inp.copy()
+    expected.add_weighted_edges_from([(7, 4, 1), (7, 5, 2)])
+    expected = nx.minimum_spanning_tree(expected)
+    assert graph_weight(inp) + delta == graph_weight(expected)
+
+    # The link-cut tree of S is restored
+    assert not tree.journal
+    assert tree.path_max(4, 5)[1] == 5
 
 
 def test_find_starting_solution():
@@ -25,3 +41,55 @@ def test_find_starting_solution():
         assert nx.is_tree(s), 'S is not a tree'
         assert leaves.issubset(terminals), 'There are non-leaf terminals'
         assert terminals.issubset(s.nodes), 'S does not contain all the terminals'
+
+
+def test_elimination_evaluator():
+    from steiner_tree.key_paths import distance_network_heuristics
+    from steiner_tree.steiner_vertices import EliminationEvaluator
+    from steiner_tree.utils import graph_weight
+
+    n_disconnected = 0
+
+    for seed in range(5):
+        g = random_graph(200, 400, seed)
+        s = distance_network_heuristics(g, set(range(0, 200, 8)))
+        evaluator = EliminationEvaluator(g, s)
+
+        for v in s.nodes:
+            induced = g.subgraph(set(s.nodes) - {v})
+            result = evaluator.evaluate(v)
+
+            if not nx.is_connected(induced):
+                n_disconnected += 1
+                assert result is None
+                continue
+
+            expected = graph_weight(nx.minimum_spanning_tree(induced))
+            weight, reconnecting_edges = result
+            tree = evaluator.tree(v, reconnecting_edges)
+
+            assert weight == graph_weight(tree) == expected
+            assert nx.is_tree(tree) and set(tree.nodes) == set(induced.nodes)
+
+    # Both cases are covered
+    assert n_disconnected
+
+
+def test_local_optimum_without_flags():
+    from steiner_tree import key_paths, steiner_vertices
+    from steiner_tree.solution import Solution
+    from steiner_tree.utils import find_starting_solution
+
+    for seed in range(5):
+        g = random_graph(300, 900, seed)
+        terminals = set(range(0, 300, 12))
+
+        for method in (steiner_vertices, key_paths):
+            s = Solution(g, find_starting_solution(g, terminals, algo='mst'), terminals)
+            s = method.local_search(g, s, terminals)
+
+            # A rescan without don't look flags finds no improvement
+            rescanned = Solution(g, s.tree.copy(), terminals)
+            rescanned = method.local_search(g, rescanned, terminals)
+
+            assert rescanned.weight == s.weight
@@ -0,0 +1,106 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+
+def test_csr_graph():
+    from steiner_tree.utils import CSRGraph
+
+    h = nx.Graph()
+    h.add_weighted_edges_from([(10, 20, 3), (20, 30, 1), (10, 30, 7), (30, 40, 2)])
+    g = CSRGraph.from_networkx(h)
+
+    assert len(g) == 4
+    assert g.number_of_edges() == 4
+    assert list(g.labels) == [10, 20, 30, 40]
+
+    u, v = g.index(10), g.index(30)
+    assert g.weight(u, v) == g.weight(v, u) == 7
+    assert sorted(g.neighbors(v).tolist()) == [g.index(10), g.index(20), g.index(40)]
+
+    out = g.to_networkx()
+    assert out._adj == h._adj
+
+    # The matrix for scipy.sparse.csgraph is built once, in the dtypes it expects
+    m = g.to_scipy()
+    assert g.to_scipy() is m
+    assert m.dtype == np.float64 and m.indices.dtype == m.indptr.dtype == np.int32
+    assert m[u, v] == 7
+
+
+def test_read_gr(tmp_path):
+    from steiner_tree.utils import read_gr
+
+    # No blank line between the sections, as in instance199.gr
+    file_path = tmp_path / 'instance.gr'
+    file_path.write_text('SECTION Graph\nNodes 3\nEdges 2\nE 1 2 5\nE 2 3 4\nEND\n'
+                         'SECTION Terminals\nTerminals 2\nT 1\nT 3\nEND\n\nEOF\n')
+
+    us, vs, ws, terminals = read_gr(str(file_path))
+
+    assert us.tolist() == [1, 2]
+    assert vs.tolist() == [2, 3]
+    assert ws.tolist() == [5, 4]
+    assert terminals == [1, 3]
+
+    # A blank line inside the block of edge lines is skipped
+    file_path.write_text('SECTION Graph\nNodes 3\nEdges 2\nE 1 2 5\n\nE 2 3 4\nEND\n'
+                         'SECTION Terminals\nTerminals 2\nT 1\nT 3\nEND\n\nEOF\n')
+
+    us, vs, ws, terminals = read_gr(str(file_path))
+
+    assert us.tolist() == [1, 2]
+    assert ws.tolist() == [5, 4]
+    assert terminals == [1, 3]
+
+
+def test_read_gr_errors(tmp_path):
+    from steiner_tree.utils import read_gr
+
+    file_path = tmp_path / 'instance.gr'
+
+    # The edges before the Edges header
+    file_path.write_text('SECTION Graph\nNodes 3\nE 1 2 5\nE 2 3 4\nEND\n\nEOF\n')
+    with pytest.raises(ValueError, match='Edges header'):
+        read_gr(str(file_path))
+
+    # Fewer edge lines than in the Edges header
+    file_path.write_text('SECTION Graph\nNodes 3\nEdges 3\nE 1 2 5\nE 2 3 4\nEND\n\n'
+                         'SECTION Terminals\nTerminals 2\nT 1\nT 3\nEND\n\nEOF\n')
+    with pytest.raises(ValueError, match='expected 3 edge lines'):
+        read_gr(str(file_path))
+
+
+def test_solution_io(tmp_path):
+    from steiner_tree.utils import CSRGraph, read_solution, write_solution
+
+    h = nx.Graph()
+    h.add_weighted_edges_from([(10, 20, 3), (20, 30, 1), (10, 30, 7), (30, 40, 2)])
+    g = CSRGraph.from_networkx(h)
+
+    s = g.from_labels(h.edge_subgraph([(10, 20), (20, 30), (30, 40)]))
+    file_path = str(tmp_path / 'solution.npy')
+    write_solution(g, s, file_path)
+
+    out = read_solution(g, file_path)
+
+    assert g.to_labels(out)._adj == g.to_labels(s)._adj
+
+
+def test_instance_size(tmp_path, monkeypatch):
+    from steiner_tree.utils import CSRGraph, instance_path, instance_size
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'public').mkdir()
+
+    with open(instance_path(1), 'w') as f:
+        f.write('SECTION Graph\nNodes 3\nEdges 2\nE 1 2 5\nE 2 3 4\nEND\n\n'
+                'SECTION Terminals\nTerminals 2\nT 1\nT 3\nEND\n\nEOF\n')
+
+    # Only the cache of the instance 3, and nothing for the instance 5
+    g = CSRGraph(3, [0, 1], [1, 2], [5, 4])
+    g.save(instance_path(3, 'npz'), terminals=np.array([0, 2]))
+
+    assert instance_size(1) == (2, 2)
+    assert instance_size(3) == (2, 2)
+    assert instance_size(5) is None
@@ -13,3 +13,26 @@ def get_path(rel_path):
 
 
 small_instances = (31, 51, 71, 29)
+
+
+def random_graph(n_nodes, n_edges, seed=0):
+    """
+    A random connected CSRGraph: a random spanning tree with
+    random extra edges, with integer weights.
+    """
+    import random
+
+    import networkx as nx
+
+    from steiner_tree.utils import CSRGraph
+
+    rnd = random.Random(seed)
+    h = nx.Graph()
+    for v in range(1, n_nodes):
+        h.add_edge(rnd.randrange(v), v, weight=rnd.randint(1, 20))
+
+    while h.number_of_edges() < n_edges:
+        u, v = rnd.sample(range(n_nodes), 2)
+        h.add_edge(u, v, weight=rnd.randint(1, 20))
+
+    return CSRGraph.from_networkx(h)